@@ -1,9 +1,39 @@
 # agent_core.py
 import time
+import re
+import math
+import heapq
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from bisect import bisect_left, insort
 from dataclasses import dataclass, asdict
 from enum import Enum
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterable, Sequence, Set, Callable, Tuple
 import random
+import uuid
+
+from checkpoint import CheckpointWriter, load_checkpoint
+from metrics import REGISTRY, STEP_BUCKETS
+from shared_pages import SharedPageSnapshot
+from lazy_page import LazyPage
+from session_store import SessionStore, url_domain
+from site_registry import SiteRegistry
+from spatial_index import Box, SpatialGrid
+
+# Метрики процесса (см. metrics.py)
+AGENT_STEPS = REGISTRY.counter("agent_steps", "Шаги агента", ("intent",))
+AGENT_STEP_ERRORS = REGISTRY.counter("agent_step_errors", "Шаги, завершившиеся исключением", ("intent",))
+AGENT_TASKS = REGISTRY.counter("agent_tasks", "Завершенные задачи по итоговому статусу", ("intent", "status"))
+AGENT_TASKS_RUNNING = REGISTRY.gauge("agent_tasks_running", "Задачи, выполняемые сейчас")
+AGENT_TASK_STEPS = REGISTRY.histogram("agent_task_steps", "Число шагов на задачу", ("intent",), STEP_BUCKETS)
+AGENT_TASK_DURATION = REGISTRY.histogram("agent_task_duration_seconds", "Время выполнения задачи", ("intent",))
+DECISION_LATENCY = REGISTRY.histogram("agent_decision_latency_seconds", "Время принятия решения")
+BROWSER_ACTIONS = REGISTRY.counter("browser_actions", "Действия браузера", ("action", "outcome"))
+BROWSER_ACTION_LATENCY = REGISTRY.histogram("browser_action_latency_seconds", "Время выполнения действия", ("action",))
+CACHE_REQUESTS = REGISTRY.counter("agent_cache_requests", "Обращения к кэшам", ("cache", "result"))
+SPECULATIVE_DECISIONS = REGISTRY.counter("agent_speculative_decisions",
+                                         "Спекулятивные решения: принятые и отброшенные", ("result",))
 
 
 class BrowserAction(Enum):
@@ -15,6 +45,7 @@ class BrowserAction(Enum):
     WAIT = "wait"
     SUBMIT = "submit"
     BACK = "back"
+    FORWARD = "forward"
     REFRESH = "refresh"
 
 
@@ -28,37 +59,749 @@ class BrowserCommand:
     description: Optional[str] = None
 
 
+class DeltaOp(Enum):
+    ADD = "add"
+    REMOVE = "remove"
+    UPDATE = "update"
+    RESET = "reset"
+
+
+@dataclass
+class PageDelta:
+    """Изменение страницы относительно предыдущего состояния"""
+    op: DeltaOp
+    selector: Optional[str] = None
+    element: Optional[Dict[str, Any]] = None
+    changes: Optional[Dict[str, Any]] = None
+
+
+# Ключевые слова намерений задачи (порядок проверки важен)
+TASK_INTENTS = (
+    ("mail", ('почт', 'mail', 'письм')),
+    ("jobs", ('ваканс', 'hh.ru', 'работ', 'job')),
+    ("food", ('заказ', 'еда', 'пицц', 'бургер', 'доставк')),
+    ("search", ('google', 'поиск')),
+)
+
+# Сайт, с которым работает агент для каждого намерения
+INTENT_DOMAINS = {
+    "mail": "mail.google.com",
+    "jobs": "hh.ru",
+    "food": "dostavka.ru",
+    "search": "google.com",
+}
+
+
+def classify_intent(task: str) -> str:
+    """Определение намерения задачи по ключевым словам"""
+    task_lower = task.lower()
+    for intent, keywords in TASK_INTENTS:
+        if any(word in task_lower for word in keywords):
+            return intent
+    return "generic"
+
+
+# Типы элементов, которые можно выделить кликом
+SELECTABLE_TYPES = ("email", "vacancy", "menu_item", "restaurant")
+
+# Высота элемента в раскладке страницы по типу (пиксели)
+ELEMENT_HEIGHTS = {
+    "email": 72, "vacancy": 96, "restaurant": 88, "menu_item": 80, "cart_item": 56,
+    "search_result": 88, "heading": 48, "paragraph": 64, "input": 40, "button": 40,
+}
+DEFAULT_ELEMENT_HEIGHT = 32
+LAYOUT_MARGIN = 16
+LAYOUT_GAP = 8
+
+# Поля элементов, по которым строится текстовый индекс
+INDEXED_FIELDS = (
+    "text", "name", "title", "subject", "category", "sender", "preview",
+    "description", "snippet", "company", "cuisine", "placeholder",
+)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Окончания для грубого выделения основы (от длинных к коротким)
+_RU_ENDINGS = tuple(sorted((
+    "ями", "ами", "ого", "его", "ему", "ому", "ыми", "ими", "ать", "ять", "ить", "еть",
+    "ешь", "ует", "ют", "ая", "яя", "ое", "ее", "ые", "ие", "ый", "ий", "ой", "ом",
+    "ем", "ам", "ям", "ах", "ях", "ов", "ев", "ей", "ью",
+    "а", "я", "о", "е", "ы", "и", "у", "ю", "ь",
+), key=len, reverse=True))
+_EN_ENDINGS = ("ing", "ed", "es", "s")
+_MIN_STEM_LENGTH = 3
+
+
+def normalize_text(value: Any) -> List[str]:
+    """Нормализация текста: нижний регистр, ё → е, разбиение на слова"""
+    return _TOKEN_RE.findall(str(value).lower().replace("ё", "е"))
+
+
+def stem_word(word: str) -> str:
+    """Выделение основы слова (русский и английский) для префиксного поиска"""
+    endings = _EN_ENDINGS if word.isascii() else _RU_ENDINGS
+    for ending in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+
+class PageTextIndex:
+    """Инвертированный индекс нормализованного текста элементов страницы"""
+
+    def __init__(self, elements: Optional[Iterable[Dict[str, Any]]] = None,
+                 fields: Sequence[str] = INDEXED_FIELDS):
+        self.fields = tuple(fields)
+        self._elements: Dict[int, Dict[str, Any]] = {}
+        self._postings: Dict[str, Dict[int, Set[str]]] = {}
+        self._vocabulary: List[str] = []
+        self._by_type: Dict[str, Dict[int, None]] = {}
+        self._next_key = 0
+        if elements is not None:
+            self.rebuild(elements)
+
+    def __len__(self) -> int:
+        return len(self._elements)
+
+    def rebuild(self, elements: Iterable[Dict[str, Any]]) -> None:
+        """Полная перестройка индекса под новую страницу"""
+        self._elements = {}
+        self._postings = {}
+        self._vocabulary = []
+        self._by_type = {}
+        self._next_key = 0
+        for element in elements:
+            key = self._next_key
+            self._next_key += 1
+            self._elements[key] = element
+            self._by_type.setdefault(element.get("type", "unknown"), {})[key] = None
+            self._index_tokens(key, element, keep_sorted=False)
+        # Словарь сортируется один раз, а не вставкой каждого токена
+        self._vocabulary = sorted(self._postings)
+
+    def add(self, element: Dict[str, Any]) -> int:
+        """Добавление элемента; возвращает его ключ в индексе"""
+        key = self._next_key
+        self._next_key += 1
+        self._elements[key] = element
+        self._by_type.setdefault(element.get("type", "unknown"), {})[key] = None
+        self._index_tokens(key, element)
+        return key
+
+    def remove(self, key: int) -> Optional[Dict[str, Any]]:
+        """Удаление элемента по ключу"""
+        element = self._elements.pop(key, None)
+        if element is None:
+            return None
+        self._by_type.get(element.get("type", "unknown"), {}).pop(key, None)
+        self._unindex_tokens(key, element)
+        return element
+
+    def update(self, key: int, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Обновление полей элемента на месте с сохранением его позиции"""
+        element = self._elements.get(key)
+        if element is None:
+            return None
+        self._by_type.get(element.get("type", "unknown"), {}).pop(key, None)
+        self._unindex_tokens(key, element)
+        element.update(changes)
+        self._by_type.setdefault(element.get("type", "unknown"), {})[key] = None
+        self._index_tokens(key, element)
+        return element
+
+    def get(self, key: int) -> Optional[Dict[str, Any]]:
+        return self._elements.get(key)
+
+    def items(self) -> List[Tuple[int, Dict[str, Any]]]:
+        """Пары (ключ, элемент) в порядке страницы"""
+        return list(self._elements.items())
+
+    def _index_tokens(self, key: int, element: Dict[str, Any], keep_sorted: bool = True) -> None:
+        for field in self.fields:
+            value = element.get(field)
+            if value is None:
+                continue
+            for token in normalize_text(value):
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = {}
+                    if keep_sorted:
+                        insort(self._vocabulary, token)
+                postings.setdefault(key, set()).add(field)
+
+    def _unindex_tokens(self, key: int, element: Dict[str, Any]) -> None:
+        for field in self.fields:
+            value = element.get(field)
+            if value is None:
+                continue
+            for token in normalize_text(value):
+                postings = self._postings.get(token)
+                if postings is None:
+                    continue
+                postings.pop(key, None)
+                if not postings:
+                    del self._postings[token]
+                    position = bisect_left(self._vocabulary, token)
+                    if position < len(self._vocabulary) and self._vocabulary[position] == token:
+                        del self._vocabulary[position]
+
+    def elements(self) -> List[Dict[str, Any]]:
+        """Все элементы в порядке страницы"""
+        return list(self._elements.values())
+
+    def of_type(self, *types: str) -> List[Dict[str, Any]]:
+        """Элементы заданных типов в порядке страницы"""
+        keys = set()
+        for elem_type in types:
+            keys.update(self._by_type.get(elem_type, ()))
+        return [self._elements[key] for key in sorted(keys)]
+
+    def _prefix_keys(self, stem: str, fields: Optional[Sequence[str]]) -> Set[int]:
+        keys = set()
+        position = bisect_left(self._vocabulary, stem)
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(stem):
+            for key, matched_fields in self._postings[self._vocabulary[position]].items():
+                if fields is None or not matched_fields.isdisjoint(fields):
+                    keys.add(key)
+            position += 1
+        return keys
+
+    def search(self, query: str, fields: Optional[Sequence[str]] = None,
+               types: Optional[Sequence[str]] = None,
+               require_all: bool = True) -> List[Dict[str, Any]]:
+        """Поиск элементов по префиксам основ слов запроса
+
+        require_all=True — элемент должен содержать все слова запроса,
+        иначе достаточно любого из них.
+        """
+        stems = [stem_word(word) for word in normalize_text(query)]
+        if not stems:
+            return []
+
+        keys: Optional[Set[int]] = None
+        for stem in stems:
+            matched = self._prefix_keys(stem, fields)
+            if keys is None:
+                keys = matched
+            elif require_all:
+                keys &= matched
+            else:
+                keys |= matched
+
+        if types is not None:
+            allowed = set()
+            for elem_type in types:
+                allowed.update(self._by_type.get(elem_type, ()))
+            keys &= allowed
+
+        return [self._elements[key] for key in sorted(keys)]
+
+
+@dataclass
+class PageState:
+    """Страница в кэше назад/вперед: контент вместе с производными индексами"""
+    url: str
+    site: Optional[str]
+    index: PageTextIndex
+    element_keys: Dict[str, int]
+    layout: SpatialGrid
+    layout_ready: bool
+    layout_bottom: int
+    scroll_y: int
+    lazy_page: Optional[LazyPage]
+    window_rows: Tuple[int, int]
+    undo: Dict[int, Optional[Dict[str, Any]]]
+
+
 class BrowserSimulator:
     """Улучшенный симулятор браузера"""
 
-    def __init__(self):
+    def __init__(self, sites: Optional[SiteRegistry] = None, max_cached_pages: int = 4,
+                 max_cached_elements: int = 20_000, session_store: Optional[SessionStore] = None):
+        self.sites = sites or SITE_REGISTRY
+        self.current_site: Optional[str] = None
         self.current_url = "about:blank"
-        self.page_content = []
         self.history = []
+        self.max_history = 200
         self.window_size = (1920, 1080)
-        self.cookies = {}
-        self.session_data = {}
+        # Прокрутка окна просмотра; ленивая страница держит в памяти только порции вокруг окна
+        self.scroll_y = 0
+        self._lazy_page: Optional[LazyPage] = None
+        self._window_rows = (0, 0)
+        # Cookies и данные сессии по доменам; с session_store переживают перезапуск
+        self.cookies: Dict[str, Dict[str, Any]] = {}
+        self.session_data: Dict[str, Dict[str, Any]] = {}
+        self.session_store = session_store
+        # Элементы страницы хранятся только в индексе (порядок ключей — порядок страницы)
+        self.page_index = PageTextIndex()
+        self._element_keys: Dict[str, int] = {}
+        # Раскладка строится лениво при первом запросе по координатам
+        self.layout = SpatialGrid(cell_width=2048, cell_height=256)
+        self._layout_ready = False
+        self._layout_bottom = 0
+        # Журнал отката для REFRESH: ключ -> копия элемента до первого изменения
+        # (UPDATE/REMOVE) или None для элемента, добавленного через ADD
+        self._undo: Dict[int, Optional[Dict[str, Any]]] = {}
+        # Навигация: (id записи, url, прокрутка); кэш неактивных страниц с вытеснением LRU
+        self._entry_id = 0
+        self._next_entry_id = 1
+        self._back: List[Tuple[int, str, int]] = []
+        self._forward: List[Tuple[int, str, int]] = []
+        # Кэш ограничен и числом страниц, и суммарным числом элементов (большие страницы)
+        self.max_cached_pages = max_cached_pages
+        self.max_cached_elements = max_cached_elements
+        self._page_cache: "OrderedDict[int, PageState]" = OrderedDict()
+        self._subscribers: List[Callable[[List[PageDelta]], None]] = []
+        # Версия страницы растет при любом изменении; блокировка защищает
+        # страницу и индексы от чтения во время изменения (см. конвейерный режим агента)
+        self.page_version = 0
+        self.page_lock = threading.RLock()
+
+    @property
+    def page_content(self) -> List[Dict[str, Any]]:
+        """Элементы страницы в порядке страницы"""
+        return self.page_index.elements()
+
+    @page_content.setter
+    def page_content(self, elements: List[Dict[str, Any]]) -> None:
+        self._load_page(elements)
 
     def navigate(self, url: str) -> List[Dict[str, Any]]:
         """Переход по URL с имитацией разных сайтов"""
+        with self.page_lock:
+            if self.current_url != "about:blank":
+                self._cache_page(self._entry_id, self._capture_page())
+                self._back.append((self._entry_id, self.current_url, self.scroll_y))
+                if len(self._back) > self.max_history:
+                    self._page_cache.pop(self._back.pop(0)[0], None)
+            # Новый переход обрывает ветку «вперед»
+            for entry_id, _, _ in self._forward:
+                self._page_cache.pop(entry_id, None)
+            self._forward = []
+            self._entry_id = self._next_entry_id
+            self._next_entry_id += 1
+
         self.current_url = url
-        self.history.append({"action": "navigate", "url": url, "timestamp": time.time()})
+        self._record_history({"action": "navigate", "url": url, "timestamp": time.time()})
+        self._open(url)
+        self._notify([PageDelta(op=DeltaOp.RESET)])
+
+        domain = url_domain(url)
+        if domain is not None:
+            self._start_session(domain)
+            if self.session_store is not None:
+                self._restore_inputs(domain)
+            self._persist_session(domain)
+        return self.page_content
 
+    def _start_session(self, domain: str) -> None:
+        """Cookies домена: из хранилища сессий или новая сессия при первом визите"""
+        if domain in self.cookies:
+            return
+        entry = self.session_store.load(domain) if self.session_store is not None else None
+        if entry is not None:
+            self.cookies[domain] = entry["cookies"]
+            self.session_data[domain] = entry["session"]
+        else:
+            self.cookies[domain] = {"session_id": uuid.uuid4().hex}
+            self.session_data[domain] = {}
+
+    def _restore_inputs(self, domain: str) -> int:
+        """Заполнение полей страницы сохраненными в сессии значениями"""
+        inputs = self.session_data.get(domain, {}).get("inputs", {})
+        deltas = [PageDelta(op=DeltaOp.UPDATE, selector=selector, changes={"value": value})
+                  for selector, value in inputs.items() if self.find_element(selector) is not None]
+        return len(self.apply_deltas(deltas))
+
+    def _persist_session(self, domain: str) -> None:
+        if self.session_store is not None and domain in self.cookies:
+            self.session_store.save(domain, self.cookies[domain], self.session_data.get(domain, {}),
+                                    self.current_url)
+
+    def warm_start(self, domain: str) -> int:
+        """Открытие последней страницы домена из сохраненной сессии
+
+        Возвращает число пропущенных подготовительных шагов (переход
+        и заполненные поля) или 0, если живой сессии нет.
+        """
+        if self.session_store is None or url_domain(self.current_url) == domain:
+            return 0
+        entry = self.session_store.load(domain)
+        if entry is None or not entry.get("url"):
+            return 0
+        self.navigate(entry["url"])
+        inputs = self.session_data.get(domain, {}).get("inputs", {})
+        return 1 + sum(1 for selector in inputs if self.find_element(selector) is not None)
+
+    def _open(self, url: str, scroll_y: int = 0) -> None:
+        """Загрузка свежего контента URL (см. SITE_REGISTRY)"""
         # Имитация контента для разных сайтов
-        if "mail" in url or "почт" in url:
-            self.page_content = self._generate_email_content()
-        elif "hh.ru" in url or "ваканс" in url:
-            self.page_content = self._generate_job_content()
-        elif "доставк" in url or "еда" in url or "food" in url:
-            self.page_content = self._generate_food_content()
-        elif "google" in url or "поиск" in url:
-            self.page_content = self._generate_search_content()
+        self.current_site, content = self.sites.page_for(url)
+
+        with self.page_lock:
+            self.scroll_y = scroll_y
+            self._lazy_page = content if isinstance(content, LazyPage) else None
+            if self._lazy_page is not None:
+                self._window_rows = (0, 0)
+                content = self._materialize_window()
+            self._load_page(content)
+
+    def _capture_page(self) -> PageState:
+        """Текущая страница целиком (по ссылкам, без копирования)"""
+        return PageState(
+            url=self.current_url, site=self.current_site,
+            index=self.page_index, element_keys=self._element_keys, layout=self.layout,
+            layout_ready=self._layout_ready, layout_bottom=self._layout_bottom,
+            scroll_y=self.scroll_y, lazy_page=self._lazy_page, window_rows=self._window_rows,
+            undo=self._undo,
+        )
+
+    def _install_page(self, state: PageState) -> None:
+        """Мгновенная установка страницы из кэша без перестройки индексов"""
+        with self.page_lock:
+            self.current_url = state.url
+            self.current_site = state.site
+            self.page_index = state.index
+            self._element_keys = state.element_keys
+            self.layout = state.layout
+            self._layout_ready = state.layout_ready
+            self._layout_bottom = state.layout_bottom
+            self.scroll_y = state.scroll_y
+            self._lazy_page = state.lazy_page
+            self._window_rows = state.window_rows
+            self._undo = state.undo
+            self.page_version += 1
+
+    def _cache_page(self, entry_id: int, state: PageState) -> None:
+        self._page_cache[entry_id] = state
+        self._page_cache.move_to_end(entry_id)
+        while self._page_cache and (
+                len(self._page_cache) > self.max_cached_pages
+                or sum(len(cached.index) for cached in self._page_cache.values()) > self.max_cached_elements):
+            self._page_cache.popitem(last=False)
+
+    def _traverse(self, source: List[Tuple[int, str, int]], target: List[Tuple[int, str, int]],
+                  action: str) -> Dict[str, Any]:
+        """Переход по истории назад или вперед: из кэша, иначе повторная загрузка"""
+        if not source:
+            return {"success": False, "message": "Нет страниц для перехода"}
+
+        with self.page_lock:
+            entry_id, url, scroll_y = source.pop()
+            # Сначала забираем целевую страницу: кэширование текущей могло бы ее вытеснить
+            state = self._page_cache.pop(entry_id, None)
+            target.append((self._entry_id, self.current_url, self.scroll_y))
+            self._cache_page(self._entry_id, self._capture_page())
+            CACHE_REQUESTS.inc(cache="page", result="miss" if state is None else "hit")
+            self._entry_id = entry_id
+            if state is not None:
+                self._install_page(state)
+            else:
+                # Страница вытеснена из кэша — загружаем заново
+                self.current_url = url
+                self._open(url, scroll_y)
+        self._notify([PageDelta(op=DeltaOp.RESET)])
+
+        self._record_history({"action": action, "url": url, "timestamp": time.time()})
+        return {"success": True, "url": url, "from_cache": state is not None,
+                "message": f"Открыта страница {url}"}
+
+    def back(self) -> Dict[str, Any]:
+        """Назад по истории переходов"""
+        return self._traverse(self._back, self._forward, "back")
+
+    def forward(self) -> Dict[str, Any]:
+        """Вперед по истории переходов"""
+        return self._traverse(self._forward, self._back, "forward")
+
+    def refresh(self) -> Dict[str, Any]:
+        """Обновление страницы: возврат исходного контента без повторной генерации"""
+        with self.page_lock:
+            changed = bool(self._undo)
+            if changed:
+                self._load_page(self._original_content())
+        if changed:
+            self._notify([PageDelta(op=DeltaOp.RESET)])
+
+        self._record_history({"action": "refresh", "url": self.current_url, "timestamp": time.time()})
+        return {"success": True, "url": self.current_url, "page_changes": changed,
+                "message": "Страница обновлена" if changed else "Страница не изменялась"}
+
+    def _original_content(self) -> List[Dict[str, Any]]:
+        """Исходный контент страницы: текущие элементы с откатом изменений по журналу"""
+        elements = dict(self.page_index.items())
+        for key, original in self._undo.items():
+            if original is None:
+                elements.pop(key, None)
+            else:
+                elements[key] = original
+        # Ключи выданы в порядке страницы; удаленные элементы возвращаются на свои места
+        return [elements[key] for key in sorted(elements)]
+
+    def snapshot_state(self) -> Dict[str, Any]:
+        """Состояние браузера для контрольной точки (ссылки, без копирования)"""
+        return {
+            "current_url": self.current_url,
+            "page_content": self.page_content,
+            "history": self.history,
+            "cookies": self.cookies,
+            "session_data": self.session_data,
+            "window_size": self.window_size,
+            "scroll_y": self.scroll_y,
+            "lazy": self._lazy_page is not None,
+            "back": [[url, scroll_y] for _, url, scroll_y in self._back],
+            "forward": [[url, scroll_y] for _, url, scroll_y in self._forward],
+        }
+
+    def publish_snapshot(self, name: Optional[str] = None) -> SharedPageSnapshot:
+        """Публикация текущей страницы в общую память для процессов-воркеров
+
+        Вызывающий владеет снимком и должен закрыть его (close() или with).
+        """
+        return SharedPageSnapshot.publish(self.page_content, url=self.current_url, name=name)
+
+    def restore_state(self, state: Dict[str, Any]) -> None:
+        """Восстановление браузера из контрольной точки"""
+        self.current_url = state.get("current_url", "about:blank")
+        self.history = state.get("history", [])
+        self.cookies = state.get("cookies", {})
+        self.session_data = state.get("session_data", {})
+        self.window_size = tuple(state.get("window_size", self.window_size))
+        with self.page_lock:
+            # Кэш страниц не сохраняется: переходы по истории загрузят страницы заново
+            self._page_cache.clear()
+            self._back, self._forward = [], []
+            for stack, entries in ((self._back, state.get("back", [])), (self._forward, state.get("forward", []))):
+                for url, scroll_y in entries:
+                    stack.append((self._next_entry_id, url, scroll_y))
+                    self._next_entry_id += 1
+            self._entry_id = self._next_entry_id
+            self._next_entry_id += 1
+
+            if state.get("lazy"):
+                # Ленивая страница заново материализуется вокруг сохраненной прокрутки
+                self._open(self.current_url, state.get("scroll_y", 0))
+            else:
+                self.current_site = self.sites.resolve(self.current_url) if self.current_url != "about:blank" else None
+                self.scroll_y = state.get("scroll_y", 0)
+                self._lazy_page = None
+                self._load_page(state.get("page_content", []))
+        self._notify([PageDelta(op=DeltaOp.RESET)])
+
+    def _record_history(self, entry: Dict[str, Any]) -> None:
+        """Запись в историю с ограничением длины (для долгоживущих воркеров)"""
+        self.history.append(entry)
+        if len(self.history) > self.max_history:
+            del self.history[:len(self.history) - self.max_history]
+
+    def _load_page(self, elements: List[Dict[str, Any]]) -> None:
+        """Полная загрузка страницы в производные индексы"""
+        with self.page_lock:
+            # Новые объекты индексов: прежние могут остаться в кэше назад/вперед
+            self.page_index = PageTextIndex(elements)
+            self._element_keys = {}
+            for key, element in enumerate(self.page_index.elements()):
+                if element.get("selector"):
+                    self._element_keys[element["selector"]] = key
+            self.layout = SpatialGrid(cell_width=self.layout.cell_width, cell_height=self.layout.cell_height)
+            self._layout_ready = False
+            self._layout_bottom = 0
+            self._undo = {}
+            self.page_version += 1
+
+    def _place(self, key: int, element: Dict[str, Any]) -> None:
+        """Размещение элемента: явные bounds или следующая строка вертикального потока"""
+        bounds = element.get("bounds")
+        if bounds is not None:
+            box = tuple(bounds)
         else:
-            self.page_content = self._generate_generic_content()
+            height = ELEMENT_HEIGHTS.get(element.get("type"), DEFAULT_ELEMENT_HEIGHT)
+            box = (LAYOUT_MARGIN, self._layout_bottom + LAYOUT_GAP,
+                   max(1, self.window_size[0] - 2 * LAYOUT_MARGIN), height)
+        self.layout.insert(key, box)
+        self._layout_bottom = max(self._layout_bottom, box[1] + box[3])
+
+    def _ensure_layout(self) -> None:
+        with self.page_lock:
+            if not self._layout_ready:
+                self.layout.clear()
+                self._layout_bottom = 0
+                for key, element in self.page_index.items():
+                    self._place(key, element)
+                self._layout_ready = True
+
+    def element_bounds(self, selector: str) -> Optional[Box]:
+        """Прямоугольник элемента (x, y, ширина, высота) в координатах документа"""
+        key = self._element_keys.get(selector)
+        if key is None:
+            return None
+        self._ensure_layout()
+        return self.layout.bounds(key)
+
+    def element_at(self, x: float, y: float) -> Optional[Dict[str, Any]]:
+        """Верхний элемент в точке документа"""
+        self._ensure_layout()
+        with self.page_lock:
+            key = self.layout.hit_test(x, y)
+            return self.page_index.get(key) if key is not None else None
+
+    def elements_in(self, region: Box) -> List[Dict[str, Any]]:
+        """Элементы, пересекающие область (x, y, ширина, высота), в порядке страницы"""
+        self._ensure_layout()
+        with self.page_lock:
+            return [self.page_index.get(key) for key in self.layout.query(region)]
+
+    def _materialize_window(self) -> Optional[List[Dict[str, Any]]]:
+        """Элементы ленивой страницы вокруг окна; None, если нужные порции уже загружены
+
+        Загружается видимая полоса плюс по порции сверху и снизу, порции
+        выровнены, чтобы небольшая прокрутка не вызывала перезагрузку.
+        """
+        page = self._lazy_page
+        width, height = self.window_size
+        chunk = page.chunk_size(height)
+        first, last = page.rows_in(self.scroll_y, self.scroll_y + height)
+        start = max(0, (first // chunk - 1) * chunk)
+        stop = (math.ceil(max(last, first + 1) / chunk) + 1) * chunk
+        if (start, stop) == self._window_rows:
+            return None
+        self._window_rows = (start, stop)
+        return page.materialize(start, stop, width)
+
+    def document_height(self) -> Optional[int]:
+        """Высота документа в пикселях; None — бесконечная лента"""
+        if self._lazy_page is not None:
+            return self._lazy_page.height()
+        self._ensure_layout()
+        return self._layout_bottom + LAYOUT_GAP
+
+    def viewport(self) -> Box:
+        """Окно просмотра в координатах документа"""
+        return (0, self.scroll_y, self.window_size[0], self.window_size[1])
+
+    def visible_elements(self) -> List[Dict[str, Any]]:
+        """Элементы, попадающие в окно просмотра, в порядке страницы"""
+        return self.elements_in(self.viewport())
+
+    def cursor(self) -> Dict[str, Any]:
+        """Положение окна на странице для продолжения чтения прокруткой"""
+        height = self.document_height()
+        bottom = self.scroll_y + self.window_size[1]
+        cursor = {
+            "scroll_y": self.scroll_y,
+            "viewport_height": self.window_size[1],
+            "document_height": height,
+            "has_more_above": self.scroll_y > 0,
+            "has_more_below": height is None or bottom < height,
+        }
+        if self._lazy_page is not None:
+            cursor["rows"] = self._lazy_page.rows_in(self.scroll_y, bottom)
+            cursor["total_rows"] = self._lazy_page.total
+        return cursor
+
+    def scroll(self, dy: int) -> Dict[str, Any]:
+        """Прокрутка на dy пикселей (отрицательное значение — вверх)"""
+        reloaded = False
+        with self.page_lock:
+            height = self.document_height()
+            if height is None:
+                # Бесконечная лента: дальше загруженных порций прокрутить нельзя
+                height = self._lazy_page.gap + self._window_rows[1] * self._lazy_page.pitch
+            scroll_y = min(max(0, self.scroll_y + dy), max(0, height - self.window_size[1]))
+            moved = scroll_y != self.scroll_y
+            self.scroll_y = scroll_y
+            if self._lazy_page is not None:
+                content = self._materialize_window()
+                if content is not None:
+                    self._load_page(content)
+                    reloaded = True
+            if moved and not reloaded:
+                # Страница та же, но видимая часть другая — спекулятивные решения устарели
+                self.page_version += 1
+        if reloaded:
+            self._notify([PageDelta(op=DeltaOp.RESET)])
 
-        return self.page_content
+        result = {
+            "success": moved,
+            "scroll_y": self.scroll_y,
+            "message": f"Прокрутка до {self.scroll_y} px" if moved else "Дальше прокручивать некуда",
+            "cursor": self.cursor(),
+        }
+        self._record_history({"action": "scroll", "dy": dy, "scroll_y": self.scroll_y, "timestamp": time.time()})
+        return result
 
-    def _generate_email_content(self):
+    def subscribe(self, callback: Callable[[List[PageDelta]], None]) -> None:
+        """Подписка на изменения страницы"""
+        if callback not in self._subscribers:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[List[PageDelta]], None]) -> None:
+        """Отписка от изменений страницы"""
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def _notify(self, deltas: List[PageDelta]) -> None:
+        if not deltas:
+            return
+        for callback in list(self._subscribers):
+            callback(deltas)
+
+    def find_element(self, selector: str) -> Optional[Dict[str, Any]]:
+        """Поиск элемента по селектору"""
+        key = self._element_keys.get(selector)
+        return self.page_index.get(key) if key is not None else None
+
+    def apply_deltas(self, deltas: List[PageDelta]) -> List[PageDelta]:
+        """Инкрементальное применение изменений к странице и индексам"""
+        applied = []
+        with self.page_lock:
+            for delta in deltas:
+                if delta.op == DeltaOp.ADD and delta.element is not None:
+                    key = self.page_index.add(delta.element)
+                    self._undo[key] = None
+                    if delta.element.get("selector"):
+                        self._element_keys[delta.element["selector"]] = key
+                    if self._layout_ready:
+                        self._place(key, delta.element)
+                    applied.append(delta)
+                elif delta.op == DeltaOp.REMOVE:
+                    key = self._element_keys.pop(delta.selector, None)
+                    if key is None:
+                        continue
+                    self._remember(key)
+                    element = self.page_index.remove(key)
+                    # Остальные элементы не сдвигаются (как при абсолютном позиционировании)
+                    self.layout.remove(key)
+                    delta.element = element
+                    applied.append(delta)
+                elif delta.op == DeltaOp.UPDATE:
+                    key = self._element_keys.get(delta.selector)
+                    if key is None:
+                        continue
+                    current = self.page_index.get(key)
+                    if all(current.get(field) == value for field, value in (delta.changes or {}).items()):
+                        continue
+                    self._remember(key)
+                    delta.element = self.page_index.update(key, delta.changes or {})
+                    if self._layout_ready and "bounds" in (delta.changes or {}):
+                        self._place(key, delta.element)
+                    applied.append(delta)
+            if applied:
+                self.page_version += 1
+
+        self._notify(applied)
+        return applied
+
+    def _remember(self, key: int) -> None:
+        # Копируется только изменяемый элемент и только перед первым изменением
+        if key not in self._undo:
+            self._undo[key] = dict(self.page_index.get(key))
+
+    def _selected(self, *types: str) -> List[Dict[str, Any]]:
+        return [e for e in self.page_index.of_type(*types) if e.get("selected")]
+
+    @staticmethod
+    def _generate_email_content():
         """Генерация контента почтового сервиса"""
         emails = [
             {"type": "email", "sender": "Amazon", "subject": "Ваш заказ #12345 отправлен",
@@ -87,7 +830,8 @@ class BrowserSimulator:
 
         return emails + controls
 
-    def _generate_job_content(self):
+    @staticmethod
+    def _generate_job_content():
         """Генерация контента сайта вакансий"""
         vacancies = [
             {"type": "vacancy", "title": "AI-инженер", "company": "Яндекс",
@@ -114,7 +858,8 @@ class BrowserSimulator:
 
         return vacancies + controls
 
-    def _generate_food_content(self):
+    @staticmethod
+    def _generate_food_content():
         """Генерация контента сайта доставки еды"""
         restaurants = [
             {"type": "restaurant", "name": "Додо Пицца", "cuisine": "Пицца",
@@ -145,7 +890,8 @@ class BrowserSimulator:
 
         return restaurants + menu_items + controls
 
-    def _generate_search_content(self):
+    @staticmethod
+    def _generate_search_content():
         """Генерация контента поисковой системы"""
         results = [
             {"type": "search_result", "title": "Искусственный интеллект — Википедия",
@@ -168,7 +914,8 @@ class BrowserSimulator:
 
         return results + controls
 
-    def _generate_generic_content(self):
+    @staticmethod
+    def _generate_generic_content():
         """Генерация общего контента"""
         return [
             {"type": "heading", "text": "Добро пожаловать", "selector": ".heading-welcome"},
@@ -181,35 +928,79 @@ class BrowserSimulator:
             {"type": "button", "text": "Продолжить", "selector": ".btn-continue"},
         ]
 
+    @staticmethod
+    def _generate_feed_page() -> LazyPage:
+        """Бесконечная новостная лента (ленивая страница)"""
+        topics = ("ИИ", "машинное обучение", "робототехника", "нейросети", "анализ данных")
+
+        def load(offset: int, limit: int) -> List[Dict[str, Any]]:
+            return [{"type": "article", "title": f"Новость #{i + 1}: {topics[i % len(topics)]}",
+                     "snippet": f"Краткое содержание новости {i + 1} о теме «{topics[i % len(topics)]}»",
+                     "selector": f".article-{i + 1}"}
+                    for i in range(offset, offset + limit)]
+
+        return LazyPage(loader=load, total=100_000, row_height=96)
+
     def click(self, selector: str) -> Dict[str, Any]:
         """Клик по элементу с имитацией реакции"""
-        for item in self.page_content:
-            if item.get("selector") == selector:
-                action_result = {
-                    "success": True,
-                    "element": item.get('text', selector),
-                    "action": item.get('action', 'click'),
-                    "message": f"Выполнено: {item.get('text', 'действие')}"
-                }
-
-                # Имитация изменений после клика
-                if item.get('action') == 'delete':
-                    action_result['message'] = "Письмо удалено"
-                elif item.get('action') == 'apply':
-                    action_result['message'] = "Отклик отправлен"
-                elif item.get('action') == 'add_to_cart':
-                    action_result['message'] = "Товар добавлен в корзину"
-
-                self.history.append({
-                    "action": "click",
-                    "selector": selector,
-                    "result": action_result,
-                    "timestamp": time.time()
-                })
-
-                return action_result
-
-        return {"success": False, "message": f"Элемент {selector} не найден"}
+        item = self.find_element(selector)
+        if item is None:
+            return {"success": False, "message": f"Элемент {selector} не найден"}
+
+        action_result = {
+            "success": True,
+            "element": item.get('text', selector),
+            "action": item.get('action', 'click'),
+            "message": f"Выполнено: {item.get('text', 'действие')}"
+        }
+
+        # Изменения страницы после клика
+        deltas = []
+        if item.get('type') in SELECTABLE_TYPES:
+            deltas.append(PageDelta(op=DeltaOp.UPDATE, selector=selector,
+                                    changes={"selected": True, "unread": False}
+                                    if item.get('type') == 'email' else {"selected": True}))
+        elif item.get('action') == 'delete':
+            deltas = [PageDelta(op=DeltaOp.REMOVE, selector=e['selector']) for e in self._selected('email')]
+            action_result['message'] = "Письмо удалено" if deltas else "Нет выбранных писем"
+        elif item.get('action') == 'apply':
+            deltas = [PageDelta(op=DeltaOp.UPDATE, selector=e['selector'],
+                                changes={"selected": False, "applied": True})
+                      for e in self._selected('vacancy')]
+            action_result['message'] = "Отклик отправлен" if deltas else "Нет выбранных вакансий"
+        elif item.get('action') == 'add_to_cart':
+            for menu_item in self._selected('menu_item'):
+                deltas.append(PageDelta(op=DeltaOp.UPDATE, selector=menu_item['selector'],
+                                        changes={"selected": False}))
+                cart_selector = ".cart-" + menu_item['selector'].lstrip(".")
+                cart_item = self.find_element(cart_selector)
+                if cart_item is not None:
+                    deltas.append(PageDelta(op=DeltaOp.UPDATE, selector=cart_selector,
+                                            changes={"quantity": cart_item.get("quantity", 1) + 1}))
+                else:
+                    deltas.append(PageDelta(op=DeltaOp.ADD, selector=cart_selector, element={
+                        "type": "cart_item", "name": menu_item.get("name"), "price": menu_item.get("price"),
+                        "quantity": 1, "selector": cart_selector}))
+            action_result['message'] = "Товар добавлен в корзину" if deltas else "Нет выбранных товаров"
+
+        applied = self.apply_deltas(deltas)
+        action_result['page_changes'] = len(applied)
+
+        self._record_history({
+            "action": "click",
+            "selector": selector,
+            "result": action_result,
+            "timestamp": time.time()
+        })
+
+        return action_result
+
+    def click_at(self, x: float, y: float) -> Dict[str, Any]:
+        """Клик по координатам окна просмотра (как у настоящего браузера): попадание через пространственный индекс"""
+        item = self.element_at(x, y + self.scroll_y)
+        if item is None or not item.get("selector"):
+            return {"success": False, "message": f"В точке ({x}, {y}) нет кликабельного элемента"}
+        return self.click(item["selector"])
 
     def type_text(self, selector: str, text: str) -> Dict[str, Any]:
         """Ввод текста"""
@@ -220,7 +1011,14 @@ class BrowserSimulator:
             "message": f"Введен текст: {text}"
         }
 
-        self.history.append({
+        if self.find_element(selector) is not None:
+            self.apply_deltas([PageDelta(op=DeltaOp.UPDATE, selector=selector, changes={"value": text})])
+            domain = url_domain(self.current_url)
+            if domain is not None and domain in self.session_data:
+                self.session_data[domain].setdefault("inputs", {})[selector] = text
+                self._persist_session(domain)
+
+        self._record_history({
             "action": "type",
             "selector": selector,
             "text": text,
@@ -229,59 +1027,203 @@ class BrowserSimulator:
 
         return result
 
-    def extract_text(self) -> List[Dict[str, Any]]:
-        """Извлечение текста со страницы"""
-        return self.page_content
+    def extract_text(self, query: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Извлечение текста: видимые элементы или поиск по запросу через индекс"""
+        if query:
+            return self.page_index.search(query)
+        return self.visible_elements()
+
+    def _scroll_amount(self, command: BrowserCommand) -> int:
+        """Смещение прокрутки: coordinates=(dx, dy) или text: down/up/top/bottom/число пикселей"""
+        if command.coordinates is not None:
+            return int(command.coordinates[1])
+        direction = (command.text or "down").strip().lower()
+        if direction == "up":
+            return -self.window_size[1]
+        if direction == "top":
+            return -self.scroll_y
+        if direction == "bottom":
+            height = self.document_height()
+            return (height - self.scroll_y) if height is not None else self.window_size[1]
+        try:
+            return int(direction)
+        except ValueError:
+            return self.window_size[1]
 
     def execute_command(self, command: BrowserCommand) -> Dict[str, Any]:
         """Выполнение команды"""
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = self._dispatch_command(command)
+            outcome = "ok"
+            return result
+        finally:
+            BROWSER_ACTIONS.inc(action=command.action.value, outcome=outcome)
+            BROWSER_ACTION_LATENCY.observe(time.perf_counter() - started, action=command.action.value)
+
+    def _dispatch_command(self, command: BrowserCommand) -> Dict[str, Any]:
         if command.action == BrowserAction.NAVIGATE:
             return {"result": self.navigate(command.url)}
         elif command.action == BrowserAction.CLICK:
+            if command.selector is None and command.coordinates is not None:
+                return {"result": self.click_at(*command.coordinates)}
             return {"result": self.click(command.selector)}
         elif command.action == BrowserAction.TYPE:
             return {"result": self.type_text(command.selector, command.text)}
         elif command.action == BrowserAction.EXTRACT:
-            return {"result": self.extract_text()}
+            if command.text:
+                return {"result": self.extract_text(command.text)}
+            return {"result": self.visible_elements(), "cursor": self.cursor()}
+        elif command.action == BrowserAction.SCROLL:
+            return {"result": self.scroll(self._scroll_amount(command))}
         elif command.action == BrowserAction.WAIT:
             time.sleep(1)
             return {"result": "Ожидание 1 секунда"}
         elif command.action == BrowserAction.BACK:
-            if len(self.history) > 1:
-                self.history.pop()
-                prev_action = self.history[-1] if self.history else None
-                if prev_action and prev_action.get('action') == 'navigate':
-                    self.current_url = prev_action.get('url', 'about:blank')
-            return {"result": "Назад в истории"}
+            return {"result": self.back()}
+        elif command.action == BrowserAction.FORWARD:
+            return {"result": self.forward()}
+        elif command.action == BrowserAction.REFRESH:
+            return {"result": self.refresh()}
 
         return {"result": f"Неизвестное действие: {command.action}"}
 
 
+# Реестр встроенных сайтов; новые сайты регистрируются через SITE_REGISTRY.register()
+SITE_REGISTRY = SiteRegistry(default="generic")
+SITE_REGISTRY.register("mail", BrowserSimulator._generate_email_content,
+                       hosts=("mail.google.com", "mail.ru", "mail.yandex.ru"), keywords=("mail", "почт"))
+SITE_REGISTRY.register("jobs", BrowserSimulator._generate_job_content,
+                       hosts=("hh.ru",), keywords=("hh.ru", "ваканс"))
+SITE_REGISTRY.register("food", BrowserSimulator._generate_food_content,
+                       hosts=("dostavka.ru",), keywords=("доставк", "еда", "food"))
+SITE_REGISTRY.register("search", BrowserSimulator._generate_search_content,
+                       hosts=("google.com",), keywords=("google", "поиск"))
+SITE_REGISTRY.register("feed", BrowserSimulator._generate_feed_page,
+                       hosts=("lenta.ru",), keywords=("feed", "лента"))
+SITE_REGISTRY.register("generic", BrowserSimulator._generate_generic_content)
+
+
 class LocalLLMSimulator:
     """Имитация AI-модели для принятия решений"""
 
-    def __init__(self):
+    INTERACTIVE_TYPES = ('button', 'link', 'input')
+
+    def __init__(self, max_context_elements: int = 50, max_context_tokens: Optional[int] = None):
         self.context_memory = []
         self.max_context_size = 10
+        self.max_context_elements = max_context_elements
+        self.max_context_tokens = max_context_tokens
+        self.memory_summary = {"steps": 0, "actions": {}, "page_changes": 0}
+        self._compiled_tasks: Dict[str, List[str]] = {}
+
+    def compile_task(self, task: str) -> List[str]:
+        """Основы значимых слов задачи (с кэшированием)"""
+        stems = self._compiled_tasks.get(task)
+        CACHE_REQUESTS.inc(cache="compiled_task", result="miss" if stems is None else "hit")
+        if stems is None:
+            stems = list(dict.fromkeys(stem_word(word) for word in normalize_text(task)
+                                       if len(word) >= _MIN_STEM_LENGTH))
+            if len(self._compiled_tasks) >= 128:
+                self._compiled_tasks.clear()
+            self._compiled_tasks[task] = stems
+        return stems
+
+    @staticmethod
+    def estimate_tokens(element: Dict[str, Any]) -> int:
+        """Грубая оценка размера элемента в токенах промпта"""
+        return 1 + sum(len(normalize_text(element[field])) for field in INDEXED_FIELDS if field in element)
+
+    def select_context(self, task: str, page_context: List[Dict],
+                       page_index: PageTextIndex) -> List[Dict]:
+        """Отбор самых релевантных задаче элементов в пределах бюджета"""
+        if len(page_context) <= self.max_context_elements and self.max_context_tokens is None:
+            return page_context
+
+        scores: Dict[int, int] = {}
+        for stem in self.compile_task(task):
+            for element in page_index.search(stem):
+                scores[id(element)] = scores.get(id(element), 0) + 2
+        for element in page_index.of_type(*self.INTERACTIVE_TYPES):
+            scores[id(element)] = scores.get(id(element), 0) + 1
+
+        ranked = heapq.nlargest(
+            len(page_context) if self.max_context_tokens is not None else self.max_context_elements,
+            enumerate(page_context),
+            key=lambda pair: (scores.get(id(pair[1]), 0), -pair[0]),
+        )
+
+        selected = []
+        tokens = 0
+        for position, element in ranked:
+            if len(selected) >= self.max_context_elements:
+                break
+            if self.max_context_tokens is not None:
+                cost = self.estimate_tokens(element)
+                if tokens + cost > self.max_context_tokens:
+                    continue
+                tokens += cost
+            selected.append((position, element))
+
+        # Сохраняем порядок элементов на странице
+        return [element for _, element in sorted(selected, key=lambda pair: pair[0])]
+
+    def reset_memory(self) -> None:
+        """Очистка памяти перед новой задачей"""
+        self.context_memory = []
+        self.memory_summary = {"steps": 0, "actions": {}, "page_changes": 0}
+
+    def memory_state(self) -> Dict[str, Any]:
+        return {"context_memory": self.context_memory, "memory_summary": self.memory_summary}
+
+    def restore_memory(self, state: Dict[str, Any]) -> None:
+        self.context_memory = list(state.get("context_memory", []))
+        self.memory_summary = state.get("memory_summary", {"steps": 0, "actions": {}, "page_changes": 0})
+
+    def remember(self, step_info: Dict[str, Any]) -> None:
+        """Запись шага в скользящую память; старые шаги сжимаются в сводку"""
+        command = step_info.get("command", {})
+        action = command.get("action")
+        action = action.value if isinstance(action, BrowserAction) else action
+        result = step_info.get("result", {}).get("result")
+        self.context_memory.append({
+            "step": step_info.get("step"),
+            "action": action,
+            "target": command.get("selector") or command.get("url"),
+            "message": result.get("message") if isinstance(result, dict) else None,
+            "page_changes": len(step_info.get("page_changes", [])),
+        })
+
+        while len(self.context_memory) > self.max_context_size:
+            oldest = self.context_memory.pop(0)
+            actions = self.memory_summary["actions"]
+            actions[oldest["action"]] = actions.get(oldest["action"], 0) + 1
+            self.memory_summary["steps"] += 1
+            self.memory_summary["page_changes"] += oldest["page_changes"]
 
-    def analyze_task(self, task: str, page_context: List[Dict]) -> BrowserCommand:
+    def analyze_task(self, task: str, page_context: List[Dict],
+                     page_index: Optional[PageTextIndex] = None) -> BrowserCommand:
         """Анализ задачи и генерация следующей команды"""
 
         task_lower = task.lower()
-        page_elements_by_type = {}
+        if page_index is None:
+            page_index = PageTextIndex(page_context)
 
-        for elem in page_context:
-            elem_type = elem.get('type', 'unknown')
-            if elem_type not in page_elements_by_type:
-                page_elements_by_type[elem_type] = []
-            page_elements_by_type[elem_type].append(elem)
+        # На больших страницах решение принимается по урезанному контексту
+        selected_context = self.select_context(task, page_context, page_index)
+        if selected_context is not page_context:
+            page_context = selected_context
+            page_index = PageTextIndex(page_context)
+
+        intent = classify_intent(task)
 
         # Стратегия для почты
-        if any(word in task_lower for word in ['почт', 'mail', 'письм']):
+        if intent == "mail":
             if 'удал' in task_lower and 'спам' in task_lower:
                 # Ищем спам-письма
-                spam_emails = [e for e in page_elements_by_type.get('email', [])
-                               if 'спам' in str(e).lower() or e.get('category') == 'спам']
+                spam_emails = [e for e in page_index.search('спам', types=('email',))
+                               if not e.get('selected')]
                 if spam_emails:
                     return BrowserCommand(
                         action=BrowserAction.CLICK,
@@ -290,8 +1232,7 @@ class LocalLLMSimulator:
                     )
 
                 # Ищем кнопку удаления
-                delete_buttons = [e for e in page_elements_by_type.get('button', [])
-                                  if 'удал' in e.get('text', '').lower()]
+                delete_buttons = page_index.search('удал', fields=('text',), types=('button',))
                 if delete_buttons:
                     return BrowserCommand(
                         action=BrowserAction.CLICK,
@@ -308,7 +1249,7 @@ class LocalLLMSimulator:
 
             elif 'прочит' in task_lower or 'последн' in task_lower:
                 # Ищем входящие
-                inbox_tabs = [e for e in page_context if 'входящ' in e.get('text', '').lower()]
+                inbox_tabs = page_index.search('входящ', fields=('text',))
                 if inbox_tabs:
                     return BrowserCommand(
                         action=BrowserAction.CLICK,
@@ -322,11 +1263,11 @@ class LocalLLMSimulator:
                 )
 
         # Стратегия для вакансий
-        elif any(word in task_lower for word in ['ваканс', 'hh.ru', 'работ', 'job']):
+        elif intent == "jobs":
             if 'ai' in task_lower or 'инженер' in task_lower:
                 # Ищем поле поиска
-                search_inputs = [e for e in page_elements_by_type.get('input', [])
-                                 if any(word in e.get('text', '').lower() for word in ['поиск', 'search'])]
+                search_inputs = page_index.search('поиск search', fields=('text',), types=('input',),
+                                                  require_all=False)
 
                 if search_inputs:
                     return BrowserCommand(
@@ -343,8 +1284,7 @@ class LocalLLMSimulator:
                 )
 
             elif 'отклик' in task_lower:
-                apply_buttons = [e for e in page_elements_by_type.get('button', [])
-                                 if 'отклик' in e.get('text', '').lower()]
+                apply_buttons = page_index.search('отклик', fields=('text',), types=('button',))
                 if apply_buttons:
                     return BrowserCommand(
                         action=BrowserAction.CLICK,
@@ -353,9 +1293,9 @@ class LocalLLMSimulator:
                     )
 
         # Стратегия для заказа еды
-        elif any(word in task_lower for word in ['заказ', 'еда', 'пицц', 'бургер', 'доставк']):
+        elif intent == "food":
             if 'пицц' in task_lower:
-                pizza_items = [e for e in page_context if 'пицц' in e.get('name', '').lower()]
+                pizza_items = page_index.search('пицц', fields=('name',))
                 if pizza_items:
                     return BrowserCommand(
                         action=BrowserAction.CLICK,
@@ -363,8 +1303,8 @@ class LocalLLMSimulator:
                         description="Выбор пиццы"
                     )
 
-            add_buttons = [e for e in page_elements_by_type.get('button', [])
-                           if 'добав' in e.get('text', '').lower() or 'корзин' in e.get('text', '').lower()]
+            add_buttons = page_index.search('добав корзин', fields=('text',), types=('button',),
+                                            require_all=False)
             if add_buttons:
                 return BrowserCommand(
                     action=BrowserAction.CLICK,
@@ -394,7 +1334,7 @@ class LocalLLMSimulator:
                 )
 
         # Пытаемся найти что-то полезное на странице
-        interactive_elements = [e for e in page_context if e.get('type') in ['button', 'link', 'input']]
+        interactive_elements = page_index.of_type('button', 'link', 'input')
         if interactive_elements:
             return BrowserCommand(
                 action=BrowserAction.CLICK if interactive_elements[0].get('type') != 'input' else BrowserAction.TYPE,
@@ -409,12 +1349,84 @@ class LocalLLMSimulator:
         )
 
 
+class StepBudgetModel:
+    """Адаптивные лимиты шагов по намерениям задач
+
+    Лимит строится по распределению шагов успешно завершенных запусков:
+    quantile-квантиль, умноженный на slack, плюс margin шагов запаса.
+    Пока запусков меньше min_samples, действует общий max_steps.
+    """
+
+    def __init__(self, quantile: float = 0.95, slack: float = 1.5, margin: int = 2,
+                 min_samples: int = 5, history: int = 200):
+        self.quantile = quantile
+        self.slack = slack
+        self.margin = margin
+        self.min_samples = min_samples
+        self.history = history
+        self._steps: Dict[str, deque] = {}
+        self._durations: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, intent: str, steps: int, duration: float) -> None:
+        """Учет завершенного запуска"""
+        with self._lock:
+            self._steps.setdefault(intent, deque(maxlen=self.history)).append(steps)
+            self._durations.setdefault(intent, deque(maxlen=self.history)).append(duration)
+
+    @staticmethod
+    def _quantile(values: List[float], q: float) -> float:
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def budget(self, intent: str, max_steps: int) -> int:
+        """Лимит шагов для задачи с данным намерением"""
+        with self._lock:
+            steps = list(self._steps.get(intent, ()))
+        if len(steps) < self.min_samples:
+            return max_steps
+        learned = math.ceil(self._quantile(steps, self.quantile) * self.slack) + self.margin
+        return max(1, min(max_steps, learned))
+
+    def plan(self, tasks: List[str]) -> Dict[str, Any]:
+        """Оценка шагов и времени для пачки задач по накопленной статистике"""
+        plan = {"tasks": len(tasks), "expected_steps": 0.0, "p95_steps": 0.0,
+                "expected_time": 0.0, "p95_time": 0.0, "unknown_intents": 0}
+        with self._lock:
+            for task in tasks:
+                intent = classify_intent(task)
+                steps = list(self._steps.get(intent, ()))
+                durations = list(self._durations.get(intent, ()))
+                if not steps:
+                    plan["unknown_intents"] += 1
+                    continue
+                plan["expected_steps"] += sum(steps) / len(steps)
+                plan["p95_steps"] += self._quantile(steps, 0.95)
+                plan["expected_time"] += sum(durations) / len(durations)
+                plan["p95_time"] += self._quantile(durations, 0.95)
+        return plan
+
+
 class AutonomousBrowserAgent:
     """Автономный AI-агент с улучшенной логикой"""
 
-    def __init__(self):
-        self.browser = BrowserSimulator()
+    def __init__(self, decision_backend: Optional[Any] = None,
+                 step_budgets: Optional[StepBudgetModel] = None,
+                 checkpoint_path: Optional[str] = None, checkpoint_every: int = 5,
+                 pipelined: bool = False, session_store: Optional[SessionStore] = None):
+        self.browser = BrowserSimulator(session_store=session_store)
         self.llm = LocalLLMSimulator()
+        # Внешний бэкенд решений (см. decision_backend.py); по умолчанию — self.llm
+        self.decision_backend = decision_backend
+        # Модель лимитов шагов можно разделять между агентами
+        self.step_budgets = step_budgets or StepBudgetModel()
+        self._cancel_event = threading.Event()
+        # Контрольные точки: каждые checkpoint_every шагов в checkpoint_path
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self._checkpoint: Optional[CheckpointWriter] = None
+        # Конвейерный режим: следующее решение считается во время выполнения команды
+        self.pipelined = pipelined
         self.task_state = {
             "current_task": None,
             "step_count": 0,
@@ -425,9 +1437,24 @@ class AutonomousBrowserAgent:
         }
         self.max_steps = 30
         self.learned_patterns = []
+        self._page_deltas: List[PageDelta] = []
+        self.browser.subscribe(self._on_page_change)
+
+    def _on_page_change(self, deltas: List[PageDelta]) -> None:
+        """Накопление изменений страницы за текущий шаг"""
+        self._page_deltas.extend(deltas)
+
+    def cancel(self) -> None:
+        """Кооперативная отмена текущей задачи (проверяется перед каждым шагом)"""
+        self._cancel_event.set()
+
+    def process_task(self, task: str, timeout: Optional[float] = None,
+                     cancel_event: Optional[threading.Event] = None) -> Dict[str, Any]:
+        """Основной метод обработки задачи
 
-    def process_task(self, task: str) -> Dict[str, Any]:
-        """Основной метод обработки задачи"""
+        timeout — ограничение по времени в секундах, cancel_event — внешний
+        флаг отмены. Оба проверяются перед каждым шагом.
+        """
         self.task_state = {
             "current_task": task,
             "step_count": 0,
@@ -436,54 +1463,198 @@ class AutonomousBrowserAgent:
             "start_time": time.time(),
             "error_count": 0
         }
+        self.llm.reset_memory()
+        intent = classify_intent(task)
+        step_budget = self.step_budgets.budget(intent, self.max_steps)
+        # Живая сессия сайта задачи позволяет пропустить переход и заполнение полей
+        if self.browser.session_store is not None and intent in INTENT_DOMAINS:
+            self.task_state["warm_steps"] = self.browser.warm_start(INTENT_DOMAINS[intent])
+        if self.checkpoint_path:
+            self._checkpoint = CheckpointWriter(
+                self.checkpoint_path, {"task": task, "intent": intent, "step_budget": step_budget,
+                                       "warm_steps": self.task_state.get("warm_steps", 0)}
+            )
+
+        return self._run_task(task, intent, step_budget, [], timeout, cancel_event)
 
-        steps = []
+    def resume(self, checkpoint: Any, timeout: Optional[float] = None,
+               cancel_event: Optional[threading.Event] = None) -> Dict[str, Any]:
+        """Продолжение задачи с последнего сохраненного шага
 
-        while self.task_state["step_count"] < self.max_steps:
-            current_step = self.task_state["step_count"] + 1
+        checkpoint — путь к файлу контрольных точек или результат load_checkpoint().
+        """
+        if isinstance(checkpoint, str):
+            checkpoint = load_checkpoint(checkpoint)
 
-            # Получаем текущий контекст
-            context = self.browser.extract_text()
+        steps = checkpoint.get("steps", [])
+        for step in steps:
+            if step.get("command") is not None:
+                step["command"]["action"] = BrowserAction(step["command"]["action"])
 
-            # AI принимает решение
-            command = self.llm.analyze_task(task, context)
+        self.browser.restore_state(checkpoint.get("browser", {}))
+        self.llm.restore_memory(checkpoint.get("llm", {}))
+        self.task_state = {
+            "current_task": checkpoint["task"],
+            "step_count": checkpoint.get("step_count", 0),
+            "completed_steps": [s for s in steps if 'error' not in s],
+            "status": "running",
+            "start_time": time.time() - checkpoint.get("elapsed", 0.0),
+            "error_count": checkpoint.get("error_count", 0),
+            "warm_steps": checkpoint.get("warm_steps", 0)
+        }
+        self._checkpoint = CheckpointWriter(checkpoint["path"]) if checkpoint.get("path") else None
 
-            # Выполняем команду
-            try:
-                result = self.browser.execute_command(command)
+        return self._run_task(checkpoint["task"], checkpoint["intent"], checkpoint["step_budget"],
+                              steps, timeout, cancel_event)
 
-                # Записываем шаг
-                step_info = {
-                    "step": current_step,
-                    "command": asdict(command),
-                    "result": result,
-                    "context_preview": [{"type": e.get('type'), "text": e.get('text', e.get('name', ''))[:50]}
-                                        for e in context[:3]],
-                    "timestamp": time.time() - self.task_state["start_time"]
-                }
+    # После этих действий страница обычно не меняется — следующее решение можно считать заранее
+    SPECULATE_AFTER = (BrowserAction.CLICK, BrowserAction.TYPE, BrowserAction.EXTRACT,
+                       BrowserAction.WAIT, BrowserAction.SCROLL)
 
-                steps.append(step_info)
-                self.task_state["completed_steps"].append(step_info)
+    def _decide(self, task: str, context: List[Dict]) -> BrowserCommand:
+        """Решение о следующей команде"""
+        if self.decision_backend is not None:
+            return self.decision_backend.decide(
+                task, self.llm.select_context(task, context, self.browser.page_index)
+            )
+        return self.llm.analyze_task(task, context, self.browser.page_index)
+
+    def _speculate(self, task: str) -> tuple:
+        """Решение по странице, какой она видна сейчас; возвращает (версия страницы, команда)"""
+        # Под блокировкой только снимок ссылок на живые элементы (select_context узнает их
+        # в индексе страницы); решение не задерживает действия, устаревшее отсеет версия
+        with self.browser.page_lock:
+            version = self.browser.page_version
+            context = list(self.browser.extract_text())
+        return version, self._decide(task, context)
+
+    def _save_checkpoint(self, new_steps: List[Dict[str, Any]]) -> None:
+        self._checkpoint.append(new_steps, {
+            "step_count": self.task_state["step_count"],
+            "error_count": self.task_state["error_count"],
+            "elapsed": time.time() - self.task_state["start_time"],
+            "browser": self.browser.snapshot_state(),
+            "llm": self.llm.memory_state(),
+        })
 
-                # Проверяем завершение
-                if self._is_task_completed(task, context, current_step):
-                    self.task_state["status"] = "completed"
+    def _run_task(self, task: str, intent: str, step_budget: int, steps: List[Dict[str, Any]],
+                  timeout: Optional[float], cancel_event: Optional[threading.Event]) -> Dict[str, Any]:
+        """Цикл шагов задачи (общий для нового запуска и продолжения)"""
+        self._cancel_event = cancel_event or threading.Event()
+        deadline = time.time() + timeout if timeout is not None else None
+        saved_steps = len(steps)
+        context = self.browser.extract_text()
+        speculator = ThreadPoolExecutor(max_workers=1, thread_name_prefix="speculate") if self.pipelined else None
+        speculation = None
+        AGENT_TASKS_RUNNING.inc()
+
+        try:
+            while self.task_state["step_count"] < step_budget:
+                if self._cancel_event.is_set():
+                    self.task_state["status"] = "cancelled"
                     break
-
-            except Exception as e:
-                self.task_state["error_count"] += 1
-                steps.append({
-                    "step": current_step,
-                    "error": str(e),
-                    "command": asdict(command),
-                    "timestamp": time.time() - self.task_state["start_time"]
-                })
-
-                if self.task_state["error_count"] > 5:
-                    self.task_state["status"] = "error"
+                if deadline is not None and time.time() >= deadline:
+                    self.task_state["status"] = "timeout"
                     break
 
-            self.task_state["step_count"] = current_step
+                current_step = self.task_state["step_count"] + 1
+
+                # Получаем текущий контекст
+                context = self.browser.extract_text()
+
+                # AI принимает решение (или берет спекулятивное, если страница не изменилась)
+                decision_started = time.perf_counter()
+                command = None
+                if speculation is not None:
+                    try:
+                        version, speculative_command = speculation.result()
+                    except Exception:
+                        version, speculative_command = None, None
+                    speculation = None
+                    if version == self.browser.page_version:
+                        command = speculative_command
+                    SPECULATIVE_DECISIONS.inc(result="hit" if command is not None else "miss")
+                speculative = command is not None
+                AGENT_STEPS.inc(intent=intent)
+                try:
+                    # Сбой бэкенда решений (таймаут, ошибка сервера) — такая же ошибка шага
+                    if command is None:
+                        command = self._decide(task, context)
+                    decision_time = time.perf_counter() - decision_started
+                    DECISION_LATENCY.observe(decision_time)
+
+                    # Выполняем команду
+                    self._page_deltas = []
+                    action_started = time.perf_counter()
+                    if speculator is not None and command.action in self.SPECULATE_AFTER:
+                        speculation = speculator.submit(self._speculate, task)
+                    result = self.browser.execute_command(command)
+                    action_time = time.perf_counter() - action_started
+
+                    # Записываем шаг
+                    step_info = {
+                        "step": current_step,
+                        "command": asdict(command),
+                        "result": result,
+                        "context_preview": [{"type": e.get('type'), "text": e.get('text', e.get('name', ''))[:50]}
+                                            for e in context[:3]],
+                        "page_changes": [{"op": d.op.value, "selector": d.selector} for d in self._page_deltas],
+                        "decision_time": decision_time,
+                        "action_time": action_time,
+                        "speculative": speculative,
+                        "timestamp": time.time() - self.task_state["start_time"]
+                    }
+
+                    steps.append(step_info)
+                    self.task_state["completed_steps"].append(step_info)
+                    self.llm.remember(step_info)
+
+                    # Проверяем завершение
+                    if self._is_task_completed(task, context, current_step):
+                        self.task_state["status"] = "completed"
+                        break
+
+                except Exception as e:
+                    self.task_state["error_count"] += 1
+                    AGENT_STEP_ERRORS.inc(intent=intent)
+                    steps.append({
+                        "step": current_step,
+                        "error": str(e),
+                        "command": asdict(command) if command is not None else None,
+                        "timestamp": time.time() - self.task_state["start_time"]
+                    })
+
+                    if self.task_state["error_count"] > 5:
+                        self.task_state["status"] = "error"
+                        break
+
+                self.task_state["step_count"] = current_step
+
+                if self._checkpoint is not None and current_step % self.checkpoint_every == 0:
+                    self._save_checkpoint(steps[saved_steps:])
+                    saved_steps = len(steps)
+
+            if self._checkpoint is not None:
+                # Задача завершена штатно — контрольная точка больше не нужна
+                self._checkpoint.discard()
+                self._checkpoint = None
+
+            if self.task_state["status"] == "running":
+                self.task_state["status"] = "budget_exceeded"
+            elif self.task_state["status"] == "completed" and len(steps) < self.max_steps:
+                # Принудительное завершение на max_steps в статистику не попадает
+                self.step_budgets.record(intent, len(steps), time.time() - self.task_state["start_time"])
+        finally:
+            if speculator is not None:
+                speculator.shutdown(wait=True)
+            if self.task_state["status"] == "running":
+                # Исключение вне шага (например, при записи контрольной точки)
+                self.task_state["status"] = "error"
+            # Метрики пишутся и при исключении, иначе счетчик запущенных задач «залипает»
+            AGENT_TASKS_RUNNING.dec()
+            AGENT_TASKS.inc(intent=intent, status=self.task_state["status"])
+            AGENT_TASK_STEPS.observe(len(steps), intent=intent)
+            AGENT_TASK_DURATION.observe(time.time() - self.task_state["start_time"], intent=intent)
 
         # Формируем итоговый отчет
         return {
@@ -495,6 +1666,8 @@ class AutonomousBrowserAgent:
                 "error_steps": len([s for s in steps if 'error' in s]),
                 "execution_time": time.time() - self.task_state["start_time"],
                 "final_status": self.task_state["status"],
+                "intent": intent,
+                "step_budget": step_budget,
                 "final_url": self.browser.current_url,
                 "elements_found": len(context)
             },
@@ -504,6 +1677,9 @@ class AutonomousBrowserAgent:
     def _is_task_completed(self, task: str, context: List[Dict], step: int) -> bool:
         """Определение, завершена ли задача"""
         task_lower = task.lower()
+        max_steps_reached = step >= self.max_steps
+        # Пропущенные при теплом старте шаги засчитываются как уже сделанные
+        step += self.task_state.get("warm_steps", 0)
 
         # Простая эвристика завершения
         if "удал" in task_lower and step > 3:
@@ -522,7 +1698,7 @@ class AutonomousBrowserAgent:
             if len(search_results) >= 3:
                 return True
 
-        if step >= self.max_steps:
+        if max_steps_reached:
             return True
 
         return False
\ No newline at end of file
@@ -1,10 +1,14 @@
 # app.py
 import streamlit as st
-import time
 import json
 from datetime import datetime
 import threading
 
+import plotly.express as px
+
+from agent_core import AutonomousBrowserAgent, BrowserAction
+from run_analytics import build_frames, latency_percentiles, action_timing, throughput, latency_regressions
+
 # Настройка страницы
 st.set_page_config(
     page_title="AI Браузерный Агент",
@@ -15,74 +19,7 @@ st.set_page_config(
 
 # Инициализация session_state ДО определения функций
 if 'agent' not in st.session_state:
-    # Простая имитация агента
-    class SimpleAgent:
-        def __init__(self):
-            self.history = []
-            self.current_url = "about:blank"
-
-        def process_task(self, task_text):
-            """Упрощенная обработка задачи"""
-            steps = []
-            task_lower = task_text.lower()
-
-            if "почт" in task_lower or "письм" in task_lower:
-                steps = [
-                    {"action": "navigate", "url": "https://mail.google.com", "desc": "Переход в почтовый сервис"},
-                    {"action": "click", "selector": "#inbox", "desc": "Открытие входящих"},
-                    {"action": "extract", "desc": "Чтение последних 10 писем"},
-                    {"action": "click", "selector": ".spam", "desc": "Поиск спама"},
-                    {"action": "click", "selector": ".delete", "desc": "Удаление спама"},
-                ]
-                self.current_url = "https://mail.google.com"
-            elif "ваканс" in task_lower or "hh.ru" in task_lower:
-                steps = [
-                    {"action": "navigate", "url": "https://hh.ru", "desc": "Переход на сайт вакансий"},
-                    {"action": "type", "selector": "input", "text": "AI инженер", "desc": "Ввод поискового запроса"},
-                    {"action": "click", "selector": ".search-btn", "desc": "Поиск вакансий"},
-                    {"action": "extract", "desc": "Анализ результатов"},
-                    {"action": "click", "selector": ".apply-btn", "desc": "Отклик на вакансию"},
-                ]
-                self.current_url = "https://hh.ru"
-            elif "заказ" in task_lower or "еда" in task_lower:
-                steps = [
-                    {"action": "navigate", "url": "https://dostavka.ru", "desc": "Переход на сайт доставки"},
-                    {"action": "type", "selector": ".address", "text": "Мой адрес", "desc": "Ввод адреса"},
-                    {"action": "click", "selector": ".pizza", "desc": "Выбор пиццы"},
-                    {"action": "click", "selector": ".add-to-cart", "desc": "Добавление в корзину"},
-                    {"action": "click", "selector": ".checkout", "desc": "Оформление заказа"},
-                ]
-                self.current_url = "https://dostavka.ru"
-            else:
-                steps = [
-                    {"action": "navigate", "url": "https://google.com", "desc": "Поиск информации"},
-                    {"action": "type", "selector": "input", "text": task_text, "desc": "Ввод запроса"},
-                    {"action": "click", "selector": ".search-btn", "desc": "Выполнение поиска"},
-                    {"action": "extract", "desc": "Анализ результатов"},
-                ]
-                self.current_url = "https://google.com"
-
-            # Имитация выполнения
-            result_steps = []
-            for i, step in enumerate(steps):
-                result_steps.append({
-                    "step": i + 1,
-                    "command": step,
-                    "result": f"Успешно выполнено: {step['desc']}",
-                    "url": self.current_url
-                })
-                time.sleep(0.3)  # Имитация задержки
-
-            return {
-                "task": task_text,
-                "steps": result_steps,
-                "total_steps": len(result_steps),
-                "final_url": self.current_url,
-                "history": [f"Задача: {task_text}"]
-            }
-
-
-    st.session_state.agent = SimpleAgent()
+    st.session_state.agent = AutonomousBrowserAgent()
 
 if 'tasks_history' not in st.session_state:
     st.session_state.tasks_history = []
@@ -96,36 +33,156 @@ if 'is_running' not in st.session_state:
 if 'execution_log' not in st.session_state:
     st.session_state.execution_log = []
 
+if 'active_run' not in st.session_state:
+    st.session_state.active_run = None
+
+if 'render_cache' not in st.session_state:
+    st.session_state.render_cache = {}
+
+# Период обновления фрагментов во время выполнения задачи
+REFRESH_INTERVAL = 0.5
+# Сколько элементов страницы показывать в окне браузера
+PAGE_PREVIEW_LIMIT = 30
+
+ACTION_ICONS = {
+    "navigate": "🌐", "click": "🖱️", "type": "⌨️",
+    "extract": "📋", "wait": "⏳", "scroll": "📜",
+    "back": "⬅️", "forward": "➡️", "refresh": "🔄",
+}
+
+ELEMENT_ICONS = {
+    "email": "📧", "vacancy": "💼", "restaurant": "🍴", "menu_item": "🍕",
+    "cart_item": "🛒", "search_result": "🔍", "article": "📰", "button": "🔘", "input": "⌨️",
+    "tab": "🗂️", "filter": "⚙️", "link": "🔗", "heading": "📰", "paragraph": "📄",
+}
+
 
 def run_agent_task(task_text):
-    """Запуск задачи"""
-    try:
-        st.session_state.is_running = True
-        st.session_state.current_task = task_text
+    """Запуск задачи в фоновом потоке; шаги отображаются фрагментами по мере выполнения"""
+    if st.session_state.active_run is not None:
+        st.warning("Агент уже выполняет задачу")
+        return
+
+    agent = st.session_state.agent
+    run = {
+        "task": task_text,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "result": None,
+        "error": None,
+        "done": threading.Event(),
+    }
 
-        # Запускаем агента
-        result = st.session_state.agent.process_task(task_text)
+    def worker():
+        try:
+            run["result"] = agent.process_task(task_text)
+        except Exception as e:
+            run["error"] = str(e)
+        finally:
+            run["done"].set()
+
+    run["thread"] = threading.Thread(target=worker, name="agent-task", daemon=True)
+    st.session_state.active_run = run
+    st.session_state.is_running = True
+    st.session_state.current_task = task_text
+    st.session_state.execution_log = []
+    run["thread"].start()
 
-        # Сохраняем результат
-        st.session_state.tasks_history.append({
-            "task": task_text,
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "result": result,
-            "status": "completed"
-        })
 
-        st.session_state.execution_log = result.get('steps', [])
+def collect_finished_run() -> bool:
+    """Перенос результата завершившейся задачи в историю; True, если задача только что завершилась"""
+    run = st.session_state.active_run
+    if run is None or not run["done"].is_set():
+        return False
 
-    except Exception as e:
+    if run["error"] is not None:
         st.session_state.tasks_history.append({
-            "task": task_text,
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "error": str(e),
+            "task": run["task"],
+            "timestamp": run["timestamp"],
+            "error": run["error"],
             "status": "error"
         })
-    finally:
-        st.session_state.is_running = False
-        st.session_state.current_task = None
+    else:
+        result = run["result"]
+        st.session_state.tasks_history.append({
+            "task": run["task"],
+            "timestamp": run["timestamp"],
+            "result": result,
+            "status": result["summary"]["final_status"]
+        })
+        st.session_state.execution_log = result.get("steps", [])
+
+    st.session_state.active_run = None
+    st.session_state.is_running = False
+    st.session_state.current_task = None
+    return True
+
+
+def cached_render(kind: str, key, build):
+    """Готовый текст блока; перестраивается только при смене ключа"""
+    cached = st.session_state.render_cache.get(kind)
+    if cached is None or cached[0] != key:
+        cached = (key, build())
+        st.session_state.render_cache[kind] = cached
+    return cached[1]
+
+
+def describe_element(element) -> str:
+    """Строка окна браузера для элемента страницы"""
+    icon = ELEMENT_ICONS.get(element.get("type"), "▫️")
+    elem_type = element.get("type")
+    if elem_type == "email":
+        text = f"**{element.get('sender', '')}** — {element.get('subject', '')}"
+        if element.get("unread"):
+            text += " 🆕"
+    elif elem_type == "vacancy":
+        text = f"{element.get('title', '')} в {element.get('company', '')} ({element.get('salary', '')})"
+    elif elem_type == "restaurant":
+        text = f"{element.get('name', '')} ({element.get('rating', '')}, {element.get('delivery_time', '')})"
+    elif elem_type in ("menu_item", "cart_item"):
+        text = f"{element.get('name', '')} — {element.get('price', '')}"
+        if element.get("quantity"):
+            text += f" × {element['quantity']}"
+    elif elem_type == "search_result":
+        text = element.get("title", "")
+    else:
+        text = element.get("text") or element.get("name") or element.get("title") or element.get("selector", "")
+        if element.get("value"):
+            text += f": «{element['value']}»"
+    if element.get("selected"):
+        text += " ✔️"
+    if element.get("applied"):
+        text += " (отклик отправлен)"
+    return f"{icon} {text}"
+
+
+def render_page_markdown(browser) -> str:
+    """Окно браузера из реального контента страницы агента"""
+    with browser.page_lock:
+        elements = browser.page_content[:PAGE_PREVIEW_LIMIT]
+        lines = [describe_element(e) for e in elements]
+        hidden = len(browser.page_content) - len(elements)
+    if hidden > 0:
+        lines.append(f"… и еще {hidden} элементов")
+    return "  \n".join(lines)
+
+
+def format_command(command) -> dict:
+    """Команда шага с действием в виде строки"""
+    if command is None:
+        # Шаг, на котором бэкенд решений не ответил
+        return {"action": "decide", "description": "Решение не получено"}
+    action = command.get("action")
+    return dict(command, action=action.value if isinstance(action, BrowserAction) else action)
+
+
+def format_result(result) -> str:
+    """Краткое описание результата шага"""
+    value = result.get("result") if isinstance(result, dict) else result
+    if isinstance(value, list):
+        return f"Загружено элементов: {len(value)}"
+    if isinstance(value, dict):
+        return value.get("message", json.dumps(value, ensure_ascii=False)[:200])
+    return str(value)
 
 
 # CSS стили
@@ -176,7 +233,141 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+def live_steps():
+    """Шаги текущей задачи (во время выполнения) или последней завершенной"""
+    if st.session_state.active_run is not None:
+        return list(st.session_state.agent.task_state["completed_steps"])
+    return st.session_state.execution_log
+
+
+def refresh_interval():
+    """Фрагменты обновляются по таймеру только пока агент работает"""
+    return REFRESH_INTERVAL if st.session_state.active_run is not None else None
+
+
+def render_browser_window():
+    """Окно браузера: перерисовывается только при смене страницы"""
+    if collect_finished_run():
+        st.rerun()
+
+    browser = st.session_state.agent.browser
+    st.markdown('<div class="browser-window">', unsafe_allow_html=True)
+    if browser.current_url != "about:blank":
+        st.write(f"🌐 **URL:** {browser.current_url}")
+        st.divider()
+        st.markdown(cached_render("page", (browser.current_url, browser.page_version),
+                                  lambda: render_page_markdown(browser)))
+    else:
+        st.write("🌐 **Браузер закрыт**")
+        st.write("Запустите агента, чтобы начать работу")
+    st.markdown('</div>', unsafe_allow_html=True)
+
+
+def render_execution_log():
+    """Последние 5 шагов; текст шагов строится один раз на шаг"""
+    steps = live_steps()
+    if not steps:
+        return
+
+    st.markdown('<h3 class="sub-header">📝 Лог выполнения</h3>', unsafe_allow_html=True)
+    if st.session_state.active_run is not None:
+        agent = st.session_state.agent
+        st.markdown('<p class="status-running">⏳ Агент выполняет задачу...</p>', unsafe_allow_html=True)
+        st.progress(min(1.0, agent.task_state["step_count"] / agent.max_steps),
+                    text=f"Шаг {agent.task_state['step_count']}")
+
+    cache = st.session_state.render_cache.setdefault("steps", {})
+    for step in steps[-5:]:
+        # Ключ — время шага от начала задачи: уникален в пределах прогона
+        key = (step['step'], step['timestamp'])
+        if key not in cache:
+            command = format_command(step['command'])
+            cache[key] = (command, format_result(step.get('result', step.get('error', ''))))
+        command, result_text = cache[key]
+        icon = ACTION_ICONS.get(command['action'], "⚙️")
+
+        with st.expander(f"{icon} Шаг {step['step']}: {command['description']}", expanded=False):
+            st.write(f"**Действие:** {command['action']}")
+            if command.get('url'):
+                st.write(f"**URL:** {command['url']}")
+            if command.get('text'):
+                st.write(f"**Текст:** {command['text']}")
+            st.write(f"**Результат:** {result_text}")
+    if len(cache) > 200:
+        cache.clear()
+
+
+def render_stats():
+    """Статистика по истории задач"""
+    if st.session_state.tasks_history:
+        completed = len([t for t in st.session_state.tasks_history if t['status'] == 'completed'])
+        errors = len([t for t in st.session_state.tasks_history if t['status'] != 'completed'])
+
+        col_stat1, col_stat2 = st.columns(2)
+        col_stat1.metric("Выполнено", completed)
+        col_stat2.metric("Ошибок", errors)
+    if st.session_state.active_run is not None:
+        st.caption(f"▶️ {st.session_state.active_run['task'][:40]}")
+
+
+def render_performance_page():
+    """Аналитика производительности по сохраненным запускам"""
+    st.markdown('<h1 class="main-header">📈 Производительность агента</h1>', unsafe_allow_html=True)
+
+    collect_finished_run()
+    history = st.session_state.tasks_history
+    if not history:
+        st.info("Пока нет завершенных задач — запустите агента, чтобы собрать статистику")
+        return
+
+    # История только дополняется, поэтому таблицы перестраиваются лишь при новых запусках
+    runs, steps = cached_render("analytics", len(history), lambda: build_frames(history))
+
+    col_m1, col_m2, col_m3, col_m4 = st.columns(4)
+    col_m1.metric("Запусков", len(runs))
+    col_m2.metric("Успешных", f"{(runs['status'] == 'completed').mean():.0%}")
+    col_m3.metric("Шаг p50", f"{steps['latency_ms'].median():.1f} мс")
+    col_m4.metric("Шаг p95", f"{steps['latency_ms'].quantile(0.95):.1f} мс")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown('<h3 class="sub-header">⏱️ Задержка шага</h3>', unsafe_allow_html=True)
+        st.plotly_chart(px.histogram(steps.dropna(subset=["latency_ms"]), x="latency_ms", color="action",
+                                     nbins=50, labels={"latency_ms": "мс", "action": "действие"}),
+                        use_container_width=True)
+        st.dataframe(latency_percentiles(steps).round(2), use_container_width=True)
+
+    with col2:
+        st.markdown('<h3 class="sub-header">⚙️ Время по действиям</h3>', unsafe_allow_html=True)
+        st.plotly_chart(px.bar(action_timing(steps), x="action", y="ms", color="phase",
+                               labels={"action": "действие", "ms": "среднее, мс", "phase": "этап"}),
+                        use_container_width=True)
+
+    col3, col4 = st.columns(2)
+    with col3:
+        st.markdown('<h3 class="sub-header">👣 Шагов на задачу</h3>', unsafe_allow_html=True)
+        st.plotly_chart(px.box(runs.dropna(subset=["total_steps"]), x="intent", y="total_steps", points="all",
+                               labels={"intent": "намерение", "total_steps": "шагов"}),
+                        use_container_width=True)
+
+    with col4:
+        st.markdown('<h3 class="sub-header">🚀 Пропускная способность</h3>', unsafe_allow_html=True)
+        freq = st.select_slider("Интервал:", options=["1min", "5min", "15min", "1h"], value="5min")
+        st.plotly_chart(px.bar(throughput(runs, freq), x="finished", y=["tasks", "steps"], barmode="group",
+                               labels={"finished": "время", "value": "за интервал", "variable": ""}),
+                        use_container_width=True)
+
+    st.markdown('<h3 class="sub-header">🔎 Регрессии задержки</h3>', unsafe_allow_html=True)
+    recent = st.number_input("Последних запусков:", min_value=1, value=min(20, max(1, len(runs) // 2)))
+    st.dataframe(latency_regressions(steps, recent_runs=int(recent)).round(2), use_container_width=True)
+
+
 def main():
+    view = st.sidebar.radio("Раздел:", ["🤖 Агент", "📈 Производительность"], horizontal=True)
+    if view == "📈 Производительность":
+        render_performance_page()
+        return
+
     # Заголовок приложения
     st.markdown('<h1 class="main-header">🤖 Автономный AI-агент</h1>', unsafe_allow_html=True)
 
@@ -209,9 +400,9 @@ def main():
         # Кнопки
         col_btn1, col_btn2 = st.columns(2)
         with col_btn1:
-            if st.button("🚀 Запустить агента", type="primary", use_container_width=True):
+            if st.button("🚀 Запустить агента", type="primary", use_container_width=True,
+                         disabled=st.session_state.is_running):
                 if task_input.strip():
-                    # Запускаем в основном потоке (без threading)
                     run_agent_task(task_input.strip())
                     st.rerun()
                 else:
@@ -221,13 +412,9 @@ def main():
             if st.button("🔄 Очистить историю", use_container_width=True):
                 st.session_state.tasks_history = []
                 st.session_state.execution_log = []
+                st.session_state.render_cache = {}
                 st.rerun()
 
-        # Статус
-        if st.session_state.is_running:
-            st.markdown('<p class="status-running">⏳ Агент выполняет задачу...</p>', unsafe_allow_html=True)
-            st.progress(0.7)
-
         # История
         if st.session_state.tasks_history:
             st.markdown('<h3 class="sub-header">📋 История</h3>', unsafe_allow_html=True)
@@ -235,62 +422,16 @@ def main():
                 with st.expander(f"{task['task'][:50]}... ({task['timestamp']})"):
                     st.write(f"**Статус:** {task['status']}")
                     if task['status'] == 'completed':
-                        st.success(f"✅ Выполнено за {task['result'].get('total_steps', 0)} шагов")
+                        st.success(f"✅ Выполнено за {task['result']['summary']['total_steps']} шагов")
+                    elif 'error' in task:
+                        st.error(task['error'])
 
     with col2:
         st.markdown('<h3 class="sub-header">🖥️ Симулятор браузера</h3>', unsafe_allow_html=True)
 
-        # Окно браузера
-        st.markdown('<div class="browser-window">', unsafe_allow_html=True)
-        if hasattr(st.session_state.agent, 'current_url') and st.session_state.agent.current_url != "about:blank":
-            st.write(f"🌐 **URL:** {st.session_state.agent.current_url}")
-            st.divider()
-
-            # Отображение контента
-            if "mail" in st.session_state.agent.current_url:
-                st.write("**Папки:** Входящие (15) | Спам (3) | Отправленные (8)")
-                st.write("**Письма:**")
-                st.write("📧 Amazon - Ваш заказ отправлен")
-                st.write("📧 Спам-рассылка - Вы выиграли iPhone!")
-                st.write("📧 GitHub - Новые коммиты")
-            elif "hh.ru" in st.session_state.agent.current_url:
-                st.write("**Вакансии:**")
-                st.write("💼 AI-инженер в Яндекс (от 300к)")
-                st.write("💼 ML Researcher в Сбер (от 350к)")
-                st.write("💼 Data Scientist в Тинькофф (от 280к)")
-            elif "dostavka" in st.session_state.agent.current_url:
-                st.write("**Рестораны:**")
-                st.write("🍕 Додо Пицца (4.7★, 30-40 мин)")
-                st.write("🍔 Burger King (4.5★, 25-35 мин)")
-                st.write("🍣 Суши Весла (4.8★, 40-50 мин)")
-            else:
-                st.write("**Поисковые результаты:**")
-                st.write("🔍 Искусственный интеллект — Википедия")
-                st.write("🔍 Новости AI на Хабре")
-                st.write("🔍 Курсы по Machine Learning")
-        else:
-            st.write("🌐 **Браузер закрыт**")
-            st.write("Запустите агента, чтобы начать работу")
-        st.markdown('</div>', unsafe_allow_html=True)
-
-        # Лог выполнения
-        if st.session_state.execution_log:
-            st.markdown('<h3 class="sub-header">📝 Лог выполнения</h3>', unsafe_allow_html=True)
-
-            for step in st.session_state.execution_log[-5:]:  # Последние 5 шагов
-                action_icons = {
-                    "navigate": "🌐", "click": "🖱️", "type": "⌨️",
-                    "extract": "📋", "wait": "⏳"
-                }
-                icon = action_icons.get(step['command']['action'], "⚙️")
-
-                with st.expander(f"{icon} Шаг {step['step']}: {step['command']['desc']}", expanded=False):
-                    st.write(f"**Действие:** {step['command']['action']}")
-                    if 'url' in step['command']:
-                        st.write(f"**URL:** {step['command']['url']}")
-                    if 'text' in step['command']:
-                        st.write(f"**Текст:** {step['command']['text']}")
-                    st.write(f"**Результат:** {step['result']}")
+        # Фрагменты перерисовываются независимо от остальной страницы
+        st.fragment(render_browser_window, run_every=refresh_interval())()
+        st.fragment(render_execution_log, run_every=refresh_interval())()
 
     # Боковая панель
     with st.sidebar:
@@ -303,13 +444,7 @@ def main():
 
         st.markdown('<h3 class="sub-header">📊 Статистика</h3>', unsafe_allow_html=True)
 
-        if st.session_state.tasks_history:
-            completed = len([t for t in st.session_state.tasks_history if t['status'] == 'completed'])
-            errors = len([t for t in st.session_state.tasks_history if t['status'] == 'error'])
-
-            col_stat1, col_stat2 = st.columns(2)
-            col_stat1.metric("Выполнено", completed)
-            col_stat2.metric("Ошибок", errors)
+        st.fragment(render_stats, run_every=refresh_interval())()
 
         st.divider()
 
@@ -322,7 +457,7 @@ def main():
         ]
 
         for qt in quick_tasks:
-            if st.button(f"▶️ {qt}", use_container_width=True):
+            if st.button(f"▶️ {qt}", use_container_width=True, disabled=st.session_state.is_running):
                 run_agent_task(qt)
                 st.rerun()
 
@@ -0,0 +1,77 @@
+# checkpoint.py
+import json
+import os
+import time
+from enum import Enum
+from typing import Dict, List, Any, Optional
+
+CHECKPOINT_VERSION = 1
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (set, tuple)):
+        return list(value)
+    raise TypeError(f"Не удается сериализовать {type(value).__name__}")
+
+
+class CheckpointWriter:
+    """Инкрементальная запись контрольных точек задачи в файл JSON Lines
+
+    Первая строка — заголовок задачи, далее каждая запись содержит только
+    новые шаги и текущее состояние агента и браузера.
+    """
+
+    def __init__(self, path: str, header: Optional[Dict[str, Any]] = None):
+        self.path = path
+        if header is not None:
+            record = dict(header, kind="task", version=CHECKPOINT_VERSION, created=time.time())
+            with open(self.path, "w", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=_json_default) + "\n")
+
+    def append(self, new_steps: List[Dict[str, Any]], state: Dict[str, Any]) -> None:
+        """Дозапись новых шагов и состояния; fsync, чтобы пережить падение процесса"""
+        record = dict(state, kind="state", steps=new_steps)
+        line = json.dumps(record, ensure_ascii=False, default=_json_default) + "\n"
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def discard(self) -> None:
+        """Удаление файла после штатного завершения задачи"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def load_checkpoint(path: str) -> Dict[str, Any]:
+    """Сборка последнего согласованного состояния из файла контрольных точек
+
+    Оборванная последняя строка (падение во время записи) игнорируется.
+    """
+    with open(path, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+
+    header = None
+    checkpoint: Dict[str, Any] = {"steps": []}
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            break
+        kind = record.pop("kind", None)
+        if kind == "task":
+            if record.get("version") != CHECKPOINT_VERSION:
+                raise ValueError(f"Неподдерживаемая версия контрольной точки: {record.get('version')}")
+            header = record
+        elif kind == "state":
+            checkpoint["steps"].extend(record.pop("steps", []))
+            checkpoint.update(record)
+
+    if header is None:
+        raise ValueError(f"В файле {path} нет заголовка задачи")
+
+    checkpoint.update({k: v for k, v in header.items() if k != "created"})
+    checkpoint["path"] = path
+    return checkpoint
@@ -0,0 +1,238 @@
+# decision_backend.py
+import argparse
+import json
+from abc import ABC, abstractmethod
+import queue
+import threading
+import time
+import urllib.request
+from concurrent.futures import Future
+from dataclasses import dataclass, field, asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Any, Optional
+
+from agent_core import BrowserAction, BrowserCommand, LocalLLMSimulator, PageTextIndex
+
+
+@dataclass
+class DecisionRequest:
+    task: str
+    page_context: List[Dict[str, Any]]
+    page_index: Optional[PageTextIndex] = field(default=None, repr=False)
+
+
+def command_to_dict(command: BrowserCommand) -> Dict[str, Any]:
+    """Сериализация команды в JSON-совместимый словарь"""
+    data = asdict(command)
+    data["action"] = command.action.value
+    return data
+
+
+def command_from_dict(data: Dict[str, Any]) -> BrowserCommand:
+    """Восстановление команды из словаря"""
+    data = dict(data)
+    data["action"] = BrowserAction(data["action"])
+    if data.get("coordinates") is not None:
+        data["coordinates"] = tuple(data["coordinates"])
+    return BrowserCommand(**data)
+
+
+class DecisionBackend(ABC):
+    """Базовый интерфейс бэкенда принятия решений"""
+
+    @abstractmethod
+    def decide_batch(self, requests: List[DecisionRequest]) -> List[BrowserCommand]:
+        """Решения для пачки запросов: по одной команде на запрос, в том же порядке"""
+
+    def decide(self, task: str, page_context: List[Dict[str, Any]],
+               page_index: Optional[PageTextIndex] = None) -> BrowserCommand:
+        return self.decide_batch([DecisionRequest(task, page_context, page_index)])[0]
+
+    def close(self) -> None:
+        pass
+
+
+class LocalDecisionBackend(DecisionBackend):
+    """Решения внутри процесса через LocalLLMSimulator"""
+
+    def __init__(self, llm: Optional[LocalLLMSimulator] = None):
+        self.llm = llm or LocalLLMSimulator()
+
+    def decide_batch(self, requests: List[DecisionRequest]) -> List[BrowserCommand]:
+        return [self.llm.analyze_task(r.task, r.page_context, r.page_index) for r in requests]
+
+
+class HTTPDecisionBackend(DecisionBackend):
+    """Клиент сервера решений: вся пачка уходит одним POST-запросом"""
+
+    def __init__(self, url: str = "http://127.0.0.1:8765/decide", timeout: float = 30.0):
+        self.url = url
+        self.timeout = timeout
+
+    def decide_batch(self, requests: List[DecisionRequest]) -> List[BrowserCommand]:
+        payload = json.dumps({
+            "requests": [{"task": r.task, "page_context": r.page_context} for r in requests]
+        }, ensure_ascii=False).encode("utf-8")
+        http_request = urllib.request.Request(
+            self.url, data=payload, headers={"Content-Type": "application/json; charset=utf-8"}
+        )
+        with urllib.request.urlopen(http_request, timeout=self.timeout) as response:
+            body = json.loads(response.read().decode("utf-8"))
+
+        commands = body.get("commands", [])
+        if len(commands) != len(requests):
+            raise RuntimeError(f"Сервер вернул {len(commands)} решений на {len(requests)} запросов")
+        return [command_from_dict(c) for c in commands]
+
+
+class MicroBatcher(DecisionBackend):
+    """Сбор запросов от множества агентов в микропачки
+
+    Пачка отправляется, когда набрано max_batch_size запросов
+    или с момента первого запроса прошло max_wait секунд.
+    """
+
+    def __init__(self, backend: DecisionBackend, max_batch_size: int = 16, max_wait: float = 0.01):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.stats = {"requests": 0, "batches": 0, "max_batch": 0}
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        # Проверка закрытия и постановка в очередь атомарны: после None в очереди ничего не появится
+        self._closed = False
+        self._state_lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name="decision-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, task: str, page_context: List[Dict[str, Any]],
+               page_index: Optional[PageTextIndex] = None) -> Future:
+        """Постановка запроса в очередь; результат придет в Future"""
+        future = Future()
+        with self._state_lock:
+            if self._closed:
+                raise RuntimeError("MicroBatcher закрыт")
+            self._queue.put((DecisionRequest(task, page_context, page_index), future))
+        return future
+
+    def decide_batch(self, requests: List[DecisionRequest]) -> List[BrowserCommand]:
+        futures = [self.submit(r.task, r.page_context, r.page_index) for r in requests]
+        return [f.result() for f in futures]
+
+    def close(self) -> None:
+        """Остановка фонового потока после обработки очереди"""
+        with self._state_lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(None)
+        self._worker.join()
+
+    def _run(self) -> None:
+        try:
+            self._serve()
+        finally:
+            # Запросы, оставшиеся в очереди после остановки, не должны ждать вечно
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None and not item[1].done():
+                    item[1].set_exception(RuntimeError("MicroBatcher остановлен"))
+
+    def _serve(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._dispatch(batch)
+
+    def _dispatch(self, batch: List[tuple]) -> None:
+        self.stats["requests"] += len(batch)
+        self.stats["batches"] += 1
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+
+        try:
+            commands = self.backend.decide_batch([request for request, _ in batch])
+            if len(commands) != len(batch):
+                raise RuntimeError(f"Бэкенд вернул {len(commands)} решений на {len(batch)} запросов")
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        for (_, future), command in zip(batch, commands):
+            future.set_result(command)
+
+
+class DecisionRequestHandler(BaseHTTPRequestHandler):
+    """Обработчик POST /decide локального сервера решений"""
+
+    llm = LocalLLMSimulator()
+
+    def do_POST(self):
+        if self.path != "/decide":
+            self.send_error(404)
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length).decode("utf-8"))
+            commands = [
+                command_to_dict(self.llm.analyze_task(r["task"], r.get("page_context", [])))
+                for r in body["requests"]
+            ]
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_error(400, str(e))
+            return
+
+        payload = json.dumps({"commands": commands}, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    """Создание локального сервера-заглушки на базе LocalLLMSimulator"""
+    return ThreadingHTTPServer((host, port), DecisionRequestHandler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный сервер решений для браузерного агента")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port)
+    print(f"🚀 Сервер решений: http://{args.host}:{args.port}/decide")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
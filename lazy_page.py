@@ -0,0 +1,66 @@
+# lazy_page.py
+"""Ленивые страницы: элементы генерируются порциями по мере прокрутки
+
+Генератор сайта может вернуть LazyPage вместо списка элементов.
+Браузер держит в памяти только порции вокруг окна просмотра, поэтому
+память и размер контекста зависят от высоты окна, а не от длины страницы.
+Изменения элементов (выбор, ввод текста) теряются, когда их порция
+уходит из окна.
+"""
+import math
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Any, Optional, Tuple
+
+# loader(offset, limit) -> элементы страницы с позиций offset..offset+limit
+ChunkLoader = Callable[[int, int], List[Dict[str, Any]]]
+
+
+@dataclass
+class LazyPage:
+    loader: ChunkLoader
+    # None — длина страницы заранее неизвестна (лента без конца)
+    total: Optional[int] = None
+    # Элементы ленивой страницы — строки одинаковой высоты
+    row_height: int = 80
+    gap: int = 8
+    margin: int = 16
+
+    @property
+    def pitch(self) -> int:
+        return self.row_height + self.gap
+
+    def chunk_size(self, viewport_height: int) -> int:
+        """Порция — столько строк, сколько помещается в окно"""
+        return max(1, math.ceil(viewport_height / self.pitch))
+
+    def height(self) -> Optional[int]:
+        """Высота документа или None для бесконечной ленты"""
+        if self.total is None:
+            return None
+        return self.gap + self.total * self.pitch
+
+    def rows_in(self, top: int, bottom: int) -> Tuple[int, int]:
+        """Диапазон строк [first, last), пересекающих полосу документа [top, bottom)"""
+        first = max(0, (top - self.gap) // self.pitch)
+        last = max(first, math.ceil((bottom - self.gap) / self.pitch))
+        if self.total is not None:
+            last = min(last, self.total)
+            first = min(first, last)
+        return first, last
+
+    def materialize(self, start: int, stop: int, width: int) -> List[Dict[str, Any]]:
+        """Элементы строк [start, stop) с рассчитанными bounds"""
+        if self.total is not None:
+            stop = min(stop, self.total)
+        if stop <= start:
+            return []
+        elements = self.loader(start, stop - start)
+        if self.total is None and len(elements) < stop - start:
+            # Лента закончилась раньше — длина теперь известна
+            self.total = start + len(elements)
+        for row, element in enumerate(elements, start):
+            element.setdefault("selector", f".row-{row}")
+            element["row"] = row
+            element["bounds"] = (self.margin, self.gap + row * self.pitch,
+                                 max(1, width - 2 * self.margin), self.row_height)
+        return elements
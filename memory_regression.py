@@ -0,0 +1,180 @@
+# memory_regression.py
+"""Регрессионный прогон потребления памяти агентом (tracemalloc)
+
+Запуск:   python memory_regression.py
+Обновить базовые значения:   python memory_regression.py --update-baselines
+"""
+import argparse
+import gc
+import json
+import math
+import os
+import sys
+import tracemalloc
+from typing import Dict, List, Any, Tuple
+
+from agent_core import AutonomousBrowserAgent, BrowserSimulator
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "memory_baselines.json")
+
+TASKS = [
+    "Прочитай последние 10 писем в почте и удали спам",
+    "Удали спам в почте",
+    "Найди 3 вакансии AI-инженера на hh.ru",
+    "Закажи пиццу пепперони и колу",
+    "Найди новости про ИИ",
+    "Поищи в google курсы машинного обучения",
+]
+
+
+class ScaledBrowserSimulator(BrowserSimulator):
+    """Браузер, увеличивающий каждую страницу в scale раз"""
+
+    def __init__(self, scale: int):
+        super().__init__()
+        self.scale = scale
+
+    def navigate(self, url: str) -> List[Dict[str, Any]]:
+        base = super().navigate(url)
+        self.page_content = [
+            dict(element, selector=f"{element.get('selector', '.el')}-{copy}")
+            if copy else element
+            for copy in range(self.scale) for element in base
+        ]
+        return self.page_content
+
+
+def _slope(points: List[Tuple[int, int]]) -> float:
+    """Наклон прямой МНК через точки (x, y)"""
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if not var_x:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+
+
+def _measure(agent: AutonomousBrowserAgent, tasks: int, warmup: int) -> Dict[str, float]:
+    """Байты на шаг (пиковый прирост) и удерживаемые байты на задачу
+
+    Трассировка включается до прогрева, иначе освобождение выделенных при
+    прогреве объектов вычитается из прироста. Удержание — наклон памяти
+    по снимкам после каждого полного цикла TASKS: в одной фазе цикла
+    содержимое кэшей одинаково, и результат не зависит от числа задач.
+    """
+    cycles = max(2, math.ceil(tasks / len(TASKS)))
+    tracemalloc.start()
+    try:
+        for i in range(warmup):
+            agent.process_task(TASKS[i % len(TASKS)])
+
+        worst_per_step = 0.0
+        total_steps = 0
+        samples = []
+
+        for i in range(cycles * len(TASKS)):
+            if i % len(TASKS) == 0:
+                gc.collect()
+                samples.append((i, tracemalloc.get_traced_memory()[0]))
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            result = agent.process_task(TASKS[i % len(TASKS)])
+            _, peak = tracemalloc.get_traced_memory()
+
+            steps = max(1, len(result["steps"]))
+            total_steps += steps
+            worst_per_step = max(worst_per_step, (peak - before) / steps)
+            del result
+
+        gc.collect()
+        samples.append((cycles * len(TASKS), tracemalloc.get_traced_memory()[0]))
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "bytes_per_step": round(worst_per_step),
+        "retained_per_task": round(max(0.0, _slope(samples))),
+        "steps": total_steps,
+    }
+
+
+def scenario_long_run(tasks: int) -> Dict[str, float]:
+    """Длинная серия задач на одном агенте"""
+    return _measure(AutonomousBrowserAgent(), tasks=tasks, warmup=60)
+
+
+def scenario_scaled_pages(tasks: int, scale: int = 250) -> Dict[str, float]:
+    """Задачи на страницах в scale раз больше обычных"""
+    agent = AutonomousBrowserAgent()
+    agent.browser.unsubscribe(agent._on_page_change)
+    agent.browser = ScaledBrowserSimulator(scale)
+    agent.browser.subscribe(agent._on_page_change)
+    return _measure(agent, tasks=max(1, tasks // 10), warmup=len(TASKS))
+
+
+SCENARIOS = {
+    "long_run": scenario_long_run,
+    "scaled_pages": scenario_scaled_pages,
+}
+
+
+def load_baselines(path: str = BASELINES_PATH) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {"tolerance": 0.25, "slack_bytes": 4096, "scenarios": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def check(results: Dict[str, Dict[str, float]], baselines: Dict[str, Any]) -> List[str]:
+    """Список нарушений: метрика выше базовой с учетом допуска"""
+    failures = []
+    tolerance = baselines.get("tolerance", 0.25)
+    slack = baselines.get("slack_bytes", 4096)
+    for name, measured in results.items():
+        expected = baselines.get("scenarios", {}).get(name)
+        if expected is None:
+            failures.append(f"{name}: нет базовых значений (запустите с --update-baselines)")
+            continue
+        for metric in ("bytes_per_step", "retained_per_task"):
+            limit = expected[metric] * (1 + tolerance) + slack
+            if measured[metric] > limit:
+                failures.append(f"{name}.{metric}: {measured[metric]} > {limit:.0f} (база {expected[metric]})")
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Проверка потребления памяти агентом")
+    parser.add_argument("--tasks", type=int, default=300, help="число задач в длинном прогоне")
+    parser.add_argument("--update-baselines", action="store_true", help="записать текущие значения как базовые")
+    parser.add_argument("--baselines", default=BASELINES_PATH)
+    args = parser.parse_args()
+
+    results = {}
+    for name, scenario in SCENARIOS.items():
+        results[name] = scenario(args.tasks)
+        print(f"📏 {name}: {results[name]['bytes_per_step']} Б/шаг, "
+              f"{results[name]['retained_per_task']} Б удерживается на задачу "
+              f"({results[name]['steps']} шагов)")
+
+    baselines = load_baselines(args.baselines)
+    if args.update_baselines:
+        baselines["scenarios"] = {
+            name: {k: v for k, v in measured.items() if k != "steps"} for name, measured in results.items()
+        }
+        with open(args.baselines, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"💾 Базовые значения записаны в {args.baselines}")
+        return 0
+
+    failures = check(results, baselines)
+    for failure in failures:
+        print(f"❌ {failure}")
+    if not failures:
+        print("✅ Потребление памяти в пределах базовых значений")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+# run_analytics.py
+"""Агрегаты производительности по сохраненным запускам агента (pandas)
+
+Запуски разворачиваются в две таблицы: по запускам и по шагам.
+Дальше все агрегаты считаются векторно — groupby/resample/quantile.
+"""
+from typing import Dict, List, Any, Tuple
+
+import numpy as np
+import pandas as pd
+
+RUN_COLUMNS = ["run", "task", "intent", "status", "started", "total_steps", "execution_time", "step_budget"]
+STEP_COLUMNS = ["run", "intent", "step", "action", "decision_time", "action_time", "speculative", "error", "offset"]
+
+
+def _action_name(action: Any) -> str:
+    return getattr(action, "value", action) or "unknown"
+
+
+def build_frames(history: List[Dict[str, Any]]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Таблицы запусков и шагов из истории задач (формат app.py: task, timestamp, status, result)"""
+    runs: Dict[str, list] = {column: [] for column in RUN_COLUMNS}
+    steps: Dict[str, list] = {column: [] for column in STEP_COLUMNS}
+
+    for run, entry in enumerate(history):
+        result = entry.get("result") or {}
+        summary = result.get("summary", {})
+        intent = summary.get("intent", "generic")
+        runs["run"].append(run)
+        runs["task"].append(entry.get("task"))
+        runs["intent"].append(intent)
+        runs["status"].append(entry.get("status"))
+        runs["started"].append(entry.get("timestamp"))
+        runs["total_steps"].append(summary.get("total_steps", np.nan))
+        runs["execution_time"].append(summary.get("execution_time", np.nan))
+        runs["step_budget"].append(summary.get("step_budget", np.nan))
+
+        run_steps = result.get("steps", [])
+        count = len(run_steps)
+        steps["run"].extend([run] * count)
+        steps["intent"].extend([intent] * count)
+        steps["step"].extend(s.get("step") for s in run_steps)
+        steps["action"].extend(_action_name((s.get("command") or {}).get("action")) for s in run_steps)
+        steps["decision_time"].extend(s.get("decision_time", np.nan) for s in run_steps)
+        steps["action_time"].extend(s.get("action_time", np.nan) for s in run_steps)
+        steps["speculative"].extend(bool(s.get("speculative")) for s in run_steps)
+        steps["error"].extend("error" in s for s in run_steps)
+        steps["offset"].extend(s.get("timestamp", np.nan) for s in run_steps)
+
+    runs_df = pd.DataFrame(runs, columns=RUN_COLUMNS)
+    runs_df["started"] = pd.to_datetime(runs_df["started"], format="%Y-%m-%d %H:%M:%S", errors="coerce")
+    runs_df["finished"] = runs_df["started"] + pd.to_timedelta(runs_df["execution_time"].fillna(0), unit="s")
+
+    steps_df = pd.DataFrame(steps, columns=STEP_COLUMNS)
+    steps_df[["decision_time", "action_time", "offset"]] = \
+        steps_df[["decision_time", "action_time", "offset"]].astype(float)
+    steps_df["latency_ms"] = (steps_df["decision_time"] + steps_df["action_time"]) * 1000
+    return runs_df, steps_df
+
+
+def latency_percentiles(steps: pd.DataFrame) -> pd.DataFrame:
+    """p50/p95/p99 задержки шага (мс) по действиям"""
+    timed = steps.dropna(subset=["latency_ms"])
+    if timed.empty:
+        return pd.DataFrame(columns=["p50", "p95", "p99", "steps"])
+    grouped = timed.groupby("action")["latency_ms"]
+    table = grouped.quantile([0.5, 0.95, 0.99]).unstack()
+    table.columns = ["p50", "p95", "p99"]
+    table["steps"] = grouped.size()
+    return table.sort_values("p95", ascending=False)
+
+
+def action_timing(steps: pd.DataFrame) -> pd.DataFrame:
+    """Среднее время решения и выполнения по действиям (мс), длинный формат для графика"""
+    means = steps.groupby("action")[["decision_time", "action_time"]].mean() * 1000
+    return (means.reset_index()
+            .melt(id_vars="action", var_name="phase", value_name="ms")
+            .replace({"phase": {"decision_time": "решение", "action_time": "выполнение"}}))
+
+
+def throughput(runs: pd.DataFrame, freq: str = "5min") -> pd.DataFrame:
+    """Завершенные задачи и шаги за интервал"""
+    finished = runs.dropna(subset=["finished"]).set_index("finished")
+    if finished.empty:
+        return pd.DataFrame(columns=["finished", "tasks", "steps"])
+    table = finished.resample(freq).agg({"run": "size", "total_steps": "sum"})
+    table.columns = ["tasks", "steps"]
+    return table.reset_index()
+
+
+def latency_regressions(steps: pd.DataFrame, recent_runs: int = 20, threshold: float = 1.25) -> pd.DataFrame:
+    """Медиана задержки по действиям: последние recent_runs запусков против предыдущих
+
+    Строки с ratio выше threshold — кандидаты в регрессии движка.
+    """
+    timed = steps.dropna(subset=["latency_ms"])
+    if timed.empty:
+        return pd.DataFrame(columns=["baseline_ms", "recent_ms", "ratio", "regression"])
+    cutoff = timed["run"].max() - recent_runs
+    period = np.where(timed["run"] > cutoff, "recent_ms", "baseline_ms")
+    table = timed.groupby(["action", period])["latency_ms"].median().unstack()
+    table = table.reindex(columns=["baseline_ms", "recent_ms"])
+    table["ratio"] = table["recent_ms"] / table["baseline_ms"]
+    table["regression"] = table["ratio"] > threshold
+    return table.sort_values("ratio", ascending=False)
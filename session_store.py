@@ -0,0 +1,134 @@
+# session_store.py
+"""Постоянное хранилище сессий по доменам (cookies, данные сессии, последний URL)
+
+Каталог с файлом JSON на домен: {"cookies", "session", "url", "expires"}.
+Отдельные файлы позволяют нескольким процессам-воркерам делить хранилище:
+запись одного домена не затирает остальные, а load() перечитывает файл,
+если его изменил другой процесс. Срок жизни скользящий: каждое сохранение
+продлевает запись на ttl секунд. Просроченные записи не возвращаются,
+их файлы удаляются purge() (вызывается при открытии хранилища).
+"""
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple
+from urllib.parse import urlsplit
+
+# Метка версии файла: (mtime в наносекундах, размер)
+FileStamp = Tuple[int, int]
+
+
+def url_domain(url: str) -> Optional[str]:
+    """Домен URL без www.; None для about:blank и подобных"""
+    host = urlsplit(url if "//" in url else f"//{url}").hostname
+    if not host:
+        return None
+    return host[4:] if host.startswith("www.") else host
+
+
+class SessionStore:
+    """Сессии по доменам на диске с истечением по TTL"""
+
+    def __init__(self, path: str, ttl: float = 24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # Прочитанные записи с меткой файла, из которого они прочитаны
+        self._entries: Dict[str, Tuple[FileStamp, Dict[str, Any]]] = {}
+        os.makedirs(path, exist_ok=True)
+        self.purge()
+
+    def __len__(self) -> int:
+        return sum(1 for name in os.listdir(self.path)
+                   if name.endswith(".json") and self.load(name[:-len(".json")]) is not None)
+
+    def _file(self, domain: str) -> str:
+        return os.path.join(self.path, re.sub(r"[^a-z0-9._-]", "_", domain.lower()) + ".json")
+
+    @staticmethod
+    def _stamp(file_path: str) -> Optional[FileStamp]:
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _read(self, domain: str) -> Optional[Dict[str, Any]]:
+        """Запись домена с диска; перечитывается, только если файл изменился"""
+        file_path = self._file(domain)
+        stamp = self._stamp(file_path)
+        if stamp is None:
+            self._entries.pop(domain, None)
+            return None
+        cached = self._entries.get(domain)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        try:
+            with open(file_path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            # Файл удален или поврежден — считаем, что сессии нет
+            self._entries.pop(domain, None)
+            return None
+        self._entries[domain] = (stamp, entry)
+        return entry
+
+    def load(self, domain: str) -> Optional[Dict[str, Any]]:
+        """Живая сессия домена или None"""
+        with self._lock:
+            entry = self._read(domain)
+            if entry is None or entry.get("expires", 0) <= time.time():
+                return None
+            # Копия: браузеры с общим хранилищем не должны делить вложенные словари
+            return json.loads(json.dumps(entry))
+
+    def save(self, domain: str, cookies: Dict[str, Any], session: Dict[str, Any],
+             url: Optional[str] = None) -> None:
+        """Сохранение сессии домена с продлением срока жизни"""
+        with self._lock:
+            previous = self._read(domain) or {}
+            entry = {
+                "cookies": cookies,
+                "session": session,
+                "url": url or previous.get("url"),
+                "expires": time.time() + self.ttl,
+            }
+            file_path = self._file(domain)
+            # Атомарная замена: читатель никогда не видит наполовину записанный файл;
+            # временный файл свой у каждого процесса и потока
+            tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, file_path)
+            stamp = self._stamp(file_path)
+            if stamp is not None:
+                self._entries[domain] = (stamp, json.loads(json.dumps(entry)))
+
+    def forget(self, domain: str) -> None:
+        with self._lock:
+            self._entries.pop(domain, None)
+            try:
+                os.remove(self._file(domain))
+            except FileNotFoundError:
+                pass
+
+    def purge(self) -> int:
+        """Удаление файлов просроченных сессий; возвращает их число"""
+        removed = 0
+        now = time.time()
+        with self._lock:
+            for name in os.listdir(self.path):
+                if not name.endswith(".json"):
+                    continue
+                domain = name[:-len(".json")]
+                entry = self._read(domain)
+                if entry is not None and entry.get("expires", 0) <= now:
+                    self._entries.pop(domain, None)
+                    try:
+                        os.remove(os.path.join(self.path, name))
+                        removed += 1
+                    except FileNotFoundError:
+                        pass
+        return removed
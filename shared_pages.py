@@ -0,0 +1,223 @@
+# shared_pages.py
+"""Снимки страниц в multiprocessing.shared_memory
+
+Страница упаковывается в плоский буфер:
+
+    заголовок | таблица полей | таблица элементов | строки (UTF-8)
+
+Таблица элементов — count * nfields записей (offset, length, kind).
+Воркер подключается к буферу по имени и читает значения полей прямо
+из общей памяти: без копирования всей страницы и без unpickle.
+"""
+import json
+import struct
+from collections.abc import Mapping
+from multiprocessing import shared_memory
+from typing import Dict, List, Any, Iterator, Optional
+
+_MAGIC = b"PGS1"
+_VERSION = 1
+# magic, version, nfields, count, url_off, url_len, fields_off, table_off, blob_off
+_HEADER = struct.Struct("<4sHHIIIIII")
+_SLICE = struct.Struct("<II")
+# offset, length, kind
+_ENTRY = struct.Struct("<IIB")
+
+_KIND_MISSING = 0
+_KIND_STR = 1
+_KIND_JSON = 2
+
+
+def pack_page(elements: List[Dict[str, Any]], url: str = "") -> bytes:
+    """Упаковка списка элементов в плоский бинарный формат"""
+    fields: Dict[str, int] = {}
+    for element in elements:
+        for field in element:
+            fields.setdefault(field, len(fields))
+
+    blob = bytearray()
+    interned: Dict[bytes, int] = {}
+
+    def put(data: bytes) -> int:
+        offset = interned.get(data)
+        if offset is None:
+            offset = interned[data] = len(blob)
+            blob.extend(data)
+        return offset
+
+    url_bytes = url.encode("utf-8")
+    url_off = put(url_bytes)
+
+    fields_table = bytearray()
+    for field in fields:
+        data = field.encode("utf-8")
+        fields_table += _SLICE.pack(put(data), len(data))
+
+    table = bytearray(_ENTRY.size * len(elements) * len(fields))
+    for i, element in enumerate(elements):
+        for field, value in element.items():
+            if isinstance(value, str):
+                kind, data = _KIND_STR, value.encode("utf-8")
+            else:
+                kind, data = _KIND_JSON, json.dumps(value, ensure_ascii=False).encode("utf-8")
+            _ENTRY.pack_into(table, (i * len(fields) + fields[field]) * _ENTRY.size, put(data), len(data), kind)
+
+    fields_off = _HEADER.size
+    table_off = fields_off + len(fields_table)
+    blob_off = table_off + len(table)
+    header = _HEADER.pack(_MAGIC, _VERSION, len(fields), len(elements),
+                          url_off, len(url_bytes), fields_off, table_off, blob_off)
+    return bytes(header + fields_table + table + blob)
+
+
+class SharedElement(Mapping):
+    """Элемент страницы, читающий поля из общей памяти по требованию"""
+
+    __slots__ = ("_view", "_index")
+
+    def __init__(self, view: "SharedPageView", index: int):
+        self._view = view
+        self._index = index
+
+    def __getitem__(self, field: str) -> Any:
+        position = self._view.field_positions.get(field)
+        if position is None:
+            raise KeyError(field)
+        value = self._view.read(self._index, position)
+        if value is _MISSING:
+            raise KeyError(field)
+        return value
+
+    def __iter__(self) -> Iterator[str]:
+        for field, position in self._view.field_positions.items():
+            if self._view.has(self._index, position):
+                yield field
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"SharedElement({dict(self)!r})"
+
+
+_MISSING = object()
+
+
+class SharedPageView:
+    """Подключение к опубликованному снимку страницы (только чтение)"""
+
+    def __init__(self, name: str):
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python < 3.13: параметра track нет
+            self._shm = shared_memory.SharedMemory(name=name)
+        self._buf = self._shm.buf
+
+        (magic, version, self._nfields, self._count, url_off, url_len,
+         fields_off, self._table_off, self._blob_off) = _HEADER.unpack_from(self._buf, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self.close()
+            raise ValueError(f"{name}: не снимок страницы или неподдерживаемая версия")
+
+        self.url = self._decode(url_off, url_len)
+        self.field_positions: Dict[str, int] = {}
+        for position in range(self._nfields):
+            offset, length = _SLICE.unpack_from(self._buf, fields_off + position * _SLICE.size)
+            self.field_positions[self._decode(offset, length)] = position
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int) -> SharedElement:
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        return SharedElement(self, index)
+
+    def __iter__(self) -> Iterator[SharedElement]:
+        return (SharedElement(self, i) for i in range(self._count))
+
+    def __enter__(self) -> "SharedPageView":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _decode(self, offset: int, length: int) -> str:
+        start = self._blob_off + offset
+        return str(self._buf[start:start + length], "utf-8")
+
+    def _entry(self, index: int, position: int):
+        return _ENTRY.unpack_from(self._buf, self._table_off + (index * self._nfields + position) * _ENTRY.size)
+
+    def has(self, index: int, position: int) -> bool:
+        return self._entry(index, position)[2] != _KIND_MISSING
+
+    def read(self, index: int, position: int) -> Any:
+        offset, length, kind = self._entry(index, position)
+        if kind == _KIND_MISSING:
+            return _MISSING
+        text = self._decode(offset, length)
+        return text if kind == _KIND_STR else json.loads(text)
+
+    def elements(self) -> List[SharedElement]:
+        """Ленивые элементы страницы (для LocalLLMSimulator и PageTextIndex)"""
+        return list(self)
+
+    def close(self) -> None:
+        self._buf = None
+        self._shm.close()
+
+
+class SharedPageSnapshot:
+    """Опубликованный снимок страницы; владелец отвечает за unlink()"""
+
+    def __init__(self, shm: shared_memory.SharedMemory, url: str, count: int):
+        self._shm = shm
+        self.url = url
+        self.count = count
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def size(self) -> int:
+        return self._shm.size
+
+    @classmethod
+    def publish(cls, elements: List[Dict[str, Any]], url: str = "",
+                name: Optional[str] = None) -> "SharedPageSnapshot":
+        payload = pack_page(elements, url)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=max(1, len(payload)))
+        shm.buf[:len(payload)] = payload
+        return cls(shm, url, len(elements))
+
+    def __enter__(self) -> "SharedPageSnapshot":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Закрытие и удаление сегмента общей памяти"""
+        self._shm.close()
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def analyze_snapshot(name: str, task: str) -> Dict[str, Any]:
+    """Решение агента по снимку в общей памяти (функция для ProcessPoolExecutor)"""
+    from agent_core import LocalLLMSimulator
+
+    with SharedPageView(name) as view:
+        command = LocalLLMSimulator().analyze_task(task, view.elements())
+        return {
+            "action": command.action.value,
+            "selector": command.selector,
+            "text": command.text,
+            "url": command.url,
+            "description": command.description,
+        }
@@ -0,0 +1,131 @@
+# single_flight.py
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, InvalidStateError
+from typing import Dict, Any, Callable, Hashable, Optional, Tuple
+
+from metrics import REGISTRY
+
+# Тот же счетчик, что и у кэшей agent_core (реестр возвращает существующую метрику)
+CACHE_REQUESTS = REGISTRY.counter("agent_cache_requests", "Обращения к кэшам", ("cache", "result"))
+
+
+class SingleFlight:
+    """Объединение одинаковых одновременных запусков
+
+    Пока задача с ключом выполняется, повторные запросы с тем же ключом
+    не запускают ее снова, а получают тот же результат. Завершенные
+    результаты еще ttl секунд отдаются из кэша. Результат общий для всех
+    ожидающих — его нельзя изменять.
+    """
+
+    def __init__(self, ttl: float = 5.0, max_cached: int = 256,
+                 cacheable: Optional[Callable[[Any], bool]] = None, name: str = "single_flight"):
+        self.name = name
+        self.ttl = ttl
+        self.max_cached = max_cached
+        self.cacheable = cacheable or (lambda result: True)
+        self._inflight: Dict[Hashable, Future] = {}
+        self._results: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        # RLock: колбэк уже завершенного Future вызывается сразу, под блокировкой
+        self._lock = threading.RLock()
+        self.stats = {"executions": 0, "coalesced": 0, "cache_hits": 0}
+
+    def submit(self, key: Hashable, start: Callable[[], Future]) -> Future:
+        """Future с результатом для key; start() запускает выполнение, только если его еще нет"""
+        with self._lock:
+            cached = self._cached(key)
+            if cached is not None:
+                self.stats["cache_hits"] += 1
+                CACHE_REQUESTS.inc(cache=self.name, result="hit")
+                future = Future()
+                future.set_result(cached[1])
+                return future
+
+            leader = self._inflight.get(key)
+            if leader is not None:
+                self.stats["coalesced"] += 1
+                CACHE_REQUESTS.inc(cache=self.name, result="coalesced")
+                return self._follow(leader)
+
+            # Место ведущего занимается под блокировкой, а start() вызывается уже без нее:
+            # start() может ждать чужие блокировки, которые держат наши колбэки (очередь планировщика)
+            leader = Future()
+            self.stats["executions"] += 1
+            CACHE_REQUESTS.inc(cache=self.name, result="miss")
+            self._inflight[key] = leader
+            leader.add_done_callback(lambda done: self._finish(key, done))
+            follower = self._follow(leader)
+
+        try:
+            started = start()
+        except BaseException as e:
+            leader.set_exception(e)
+            raise
+        started.add_done_callback(lambda done: self._relay(done, leader))
+        return follower
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Синхронный вариант: fn() выполняется в текущем потоке, если ключ свободен"""
+        own = Future()
+        started = []
+
+        def start() -> Future:
+            started.append(True)
+            return own
+
+        future = self.submit(key, start)
+        if started:
+            own.set_running_or_notify_cancel()
+            try:
+                own.set_result(fn())
+            except BaseException as e:
+                own.set_exception(e)
+        return future.result()
+
+    def _cached(self, key: Hashable) -> Optional[Tuple[float, Any]]:
+        cached = self._results.get(key)
+        if cached is not None and cached[0] <= time.monotonic():
+            del self._results[key]
+            return None
+        return cached
+
+    @staticmethod
+    def _relay(done: Future, target: Future) -> None:
+        """Перенос исхода done в target; target могут отменить в любой момент"""
+        try:
+            if done.cancelled():
+                target.cancel()
+            elif done.exception() is not None:
+                target.set_exception(done.exception())
+            else:
+                target.set_result(done.result())
+        except InvalidStateError:
+            # target уже отменен или завершен — исход никому не нужен
+            pass
+
+    @classmethod
+    def _follow(cls, leader: Future) -> Future:
+        # У каждого ожидающего свой Future: отмена одного не отменяет выполнение для остальных
+        follower = Future()
+        leader.add_done_callback(lambda done: cls._relay(done, follower))
+        return follower
+
+    def _finish(self, key: Hashable, done: Future) -> None:
+        with self._lock:
+            if self._inflight.get(key) is done:
+                del self._inflight[key]
+            if done.cancelled() or done.exception() is not None or self.ttl <= 0:
+                return
+            result = done.result()
+            if not self.cacheable(result):
+                return
+            self._results[key] = (time.monotonic() + self.ttl, result)
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_cached:
+                self._results.popitem(last=False)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, in_flight=len(self._inflight), cached=len(self._results))
@@ -0,0 +1,144 @@
+# site_registry.py
+import importlib
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Any, Optional, Sequence, Tuple, Union
+from urllib.parse import urlsplit
+
+PageProvider = Callable[[], List[Dict[str, Any]]]
+
+
+@dataclass
+class SiteEntry:
+    name: str
+    # Функция-генератор страницы или строка "модуль:атрибут" для ленивой загрузки
+    provider: Union[PageProvider, str]
+    hosts: Tuple[str, ...] = ()
+    keywords: Tuple[str, ...] = ()
+    patterns: Tuple[str, ...] = ()
+    priority: int = 0
+    _loaded: Optional[PageProvider] = field(default=None, repr=False)
+
+
+class SiteRegistry:
+    """Реестр симулируемых сайтов с компилированной маршрутизацией URL
+
+    Маршрутизация: точное совпадение хоста (с отбрасыванием поддоменов
+    слева), поиск ключевых подстрок по префиксному дереву и один общий
+    регулярный шаблон по всему URL. Стоимость не зависит от числа сайтов
+    для хостов и ключевых слов. Из всех совпадений — хоста, ключевых слов
+    и шаблонов — выигрывает сайт с меньшим priority (по умолчанию —
+    порядок регистрации), как в цепочке if/elif, которую реестр заменил.
+    Шаблоны не должны содержать захватывающих групп.
+    """
+
+    def __init__(self, default: str = "generic"):
+        self.default = default
+        self._sites: Dict[str, SiteEntry] = {}
+        self._hosts: Dict[str, str] = {}
+        self._keywords: Optional[Dict[str, Any]] = None
+        self._pattern: Optional[re.Pattern] = None
+        self._group_sites: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, provider: Union[PageProvider, str],
+                 hosts: Sequence[str] = (), keywords: Sequence[str] = (),
+                 patterns: Sequence[str] = (), priority: Optional[int] = None) -> None:
+        """Регистрация сайта
+
+        keywords — подстроки URL, patterns — регулярные выражения
+        (и то и другое сравнивается с URL в нижнем регистре).
+        """
+        with self._lock:
+            entry = SiteEntry(name=name, provider=provider,
+                              hosts=tuple(h.lower() for h in hosts),
+                              keywords=tuple(k.lower() for k in keywords), patterns=tuple(patterns),
+                              priority=len(self._sites) if priority is None else priority)
+            self._sites[name] = entry
+            for host in entry.hosts:
+                self._hosts[host] = name
+            self._keywords = None
+            self._pattern = None
+
+    def _compile_keywords(self) -> Dict[str, Any]:
+        # Префиксное дерево: символ -> узел; в узле под ключом None — сайт с наименьшим priority
+        root: Dict[str, Any] = {}
+        for entry in self._sites.values():
+            for keyword in entry.keywords:
+                node = root
+                for char in keyword:
+                    node = node.setdefault(char, {})
+                current = node.get(None)
+                if current is None or entry.priority < self._sites[current].priority:
+                    node[None] = entry.name
+        return root
+
+    def _compile(self) -> re.Pattern:
+        groups = []
+        self._group_sites = {}
+        for i, entry in enumerate(sorted(self._sites.values(), key=lambda e: e.priority)):
+            if entry.patterns:
+                group = f"s{i}"
+                self._group_sites[group] = entry.name
+                groups.append(f"(?P<{group}>{'|'.join(f'(?:{p})' for p in entry.patterns)})")
+        # (?!) никогда не совпадает — на случай реестра без шаблонов
+        return re.compile("|".join(groups) or "(?!)")
+
+    def resolve(self, url: str) -> str:
+        """Имя сайта для URL"""
+        url = url.lower()
+        host = urlsplit(url if "//" in url else f"//{url}").hostname or ""
+        best = None
+        while host:
+            best = self._hosts.get(host)
+            if best is not None:
+                break
+            host = host.partition(".")[2]
+
+        keywords, pattern = self._keywords, self._pattern
+        if keywords is None or pattern is None:
+            with self._lock:
+                keywords = self._keywords = self._compile_keywords()
+                pattern = self._pattern = self._compile()
+
+        for start in range(len(url)):
+            node = keywords
+            for char in url[start:]:
+                node = node.get(char)
+                if node is None:
+                    break
+                name = node.get(None)
+                if name is not None and (best is None or self._sites[name].priority < self._sites[best].priority):
+                    best = name
+
+        for match in pattern.finditer(url):
+            name = self._group_sites[match.lastgroup]
+            if best is None or self._sites[name].priority < self._sites[best].priority:
+                best = name
+        return best or self.default
+
+    def provider(self, name: str) -> PageProvider:
+        """Генератор страницы сайта (загружается при первом обращении)"""
+        entry = self._sites.get(name) or self._sites[self.default]
+        if entry._loaded is None:
+            if callable(entry.provider):
+                entry._loaded = entry.provider
+            else:
+                module_name, _, attr = entry.provider.partition(":")
+                target = importlib.import_module(module_name)
+                for part in attr.split("."):
+                    target = getattr(target, part)
+                entry._loaded = target
+        return entry._loaded
+
+    def page_for(self, url: str) -> Tuple[str, List[Dict[str, Any]]]:
+        """Имя сайта и свежий контент страницы для URL"""
+        name = self.resolve(url)
+        return name, self.provider(name)()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._sites
+
+    def __len__(self) -> int:
+        return len(self._sites)
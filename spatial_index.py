@@ -0,0 +1,104 @@
+# spatial_index.py
+"""Пространственный индекс элементов страницы для попадания по координатам
+
+Равномерная сетка: документ делится на ячейки cell_width x cell_height,
+каждый прямоугольник регистрируется во всех ячейках, которые он
+пересекает. Попадание в точку проверяет одну ячейку, запрос области —
+только пересекаемые ячейки, поэтому стоимость не зависит от числа
+элементов на странице (при ограниченном размере элементов).
+"""
+from typing import Dict, List, Iterable, Optional, Set, Tuple
+
+# x, y, ширина, высота (координаты документа, пиксели)
+Box = Tuple[int, int, int, int]
+
+
+def box_contains(box: Box, x: float, y: float) -> bool:
+    bx, by, bw, bh = box
+    return bx <= x < bx + bw and by <= y < by + bh
+
+
+def boxes_intersect(a: Box, b: Box) -> bool:
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+
+class SpatialGrid:
+    """Равномерная сетка прямоугольников с ключами-целыми
+
+    При перекрытии сверху считается элемент с большим ключом
+    (добавленный позже — отрисован поверх).
+    """
+
+    def __init__(self, cell_width: int = 256, cell_height: int = 256):
+        # Для страниц из строк во всю ширину выгоднее широкие ячейки
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+        self._boxes: Dict[int, Box] = {}
+        self._cells: Dict[Tuple[int, int], Set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._boxes)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self._boxes
+
+    def _cell_range(self, box: Box) -> List[Tuple[int, int]]:
+        x, y, w, h = box
+        cw, ch = self.cell_width, self.cell_height
+        # Правая и нижняя границы не входят в прямоугольник
+        x0, y0 = int(x // cw), int(y // ch)
+        x1, y1 = int((x + max(w, 1) - 1) // cw), int((y + max(h, 1) - 1) // ch)
+        if x0 == x1 and y0 == y1:
+            return [(x0, y0)]
+        return [(cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)]
+
+    def insert(self, key: int, box: Box) -> None:
+        if key in self._boxes:
+            self.remove(key)
+        self._boxes[key] = box
+        cells = self._cells
+        for cell in self._cell_range(box):
+            keys = cells.get(cell)
+            if keys is None:
+                cells[cell] = {key}
+            else:
+                keys.add(key)
+
+    def remove(self, key: int) -> Optional[Box]:
+        box = self._boxes.pop(key, None)
+        if box is None:
+            return None
+        for cell in self._cell_range(box):
+            keys = self._cells.get(cell)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._cells[cell]
+        return box
+
+    def bounds(self, key: int) -> Optional[Box]:
+        return self._boxes.get(key)
+
+    def clear(self) -> None:
+        self._boxes = {}
+        self._cells = {}
+
+    def hit_test(self, x: float, y: float) -> Optional[int]:
+        """Ключ верхнего элемента в точке или None"""
+        candidates = self._cells.get((int(x // self.cell_width), int(y // self.cell_height)), ())
+        hits = [key for key in candidates if box_contains(self._boxes[key], x, y)]
+        return max(hits) if hits else None
+
+    def query(self, region: Box) -> List[int]:
+        """Ключи элементов, пересекающих область, в порядке ключей"""
+        found: Set[int] = set()
+        for cell in self._cell_range(region):
+            for key in self._cells.get(cell, ()):
+                if key not in found and boxes_intersect(self._boxes[key], region):
+                    found.add(key)
+        return sorted(found)
+
+    def rebuild(self, items: Iterable[Tuple[int, Box]]) -> None:
+        self.clear()
+        for key, box in items:
+            self.insert(key, box)
@@ -0,0 +1,263 @@
+# task_scheduler.py
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Optional, Callable, Hashable
+
+from agent_core import AutonomousBrowserAgent, StepBudgetModel, INTENT_DOMAINS, classify_intent, normalize_text
+from single_flight import SingleFlight
+
+
+def task_domain(task: str) -> str:
+    """Сайт, на который пойдет агент при выполнении задачи"""
+    return INTENT_DOMAINS.get(classify_intent(task), "generic")
+
+
+class TokenBucket:
+    """Ограничение частоты запусков: rate в секунду, не больше burst подряд"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, now: float) -> bool:
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self, now: float) -> float:
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+@dataclass(order=True)
+class ScheduledTask:
+    sort_key: tuple
+    task: str = field(compare=False)
+    submitter: str = field(compare=False)
+    domain: str = field(compare=False)
+    priority: int = field(compare=False)
+    submitted_at: float = field(compare=False)
+    future: Future = field(compare=False)
+    timeout: Optional[float] = field(default=None, compare=False)
+
+
+class TaskScheduler:
+    """Планировщик задач агентов с лимитами по доменам
+
+    - не больше domain_limits[domain] (или default_domain_limit) сессий на сайт одновременно;
+    - не чаще domain_rates[domain] запусков в секунду на сайт;
+    - из очередей отправителей выбирается задача с наибольшим приоритетом,
+      при равенстве — отправитель, которого обслуживали дольше всех назад;
+    - одинаковые задачи (тот же нормализованный текст, сайт и состояние сайта
+      из site_state) выполняются один раз, результат получают все отправители;
+      успешный результат еще result_ttl секунд отдается из кэша.
+    """
+
+    def __init__(self, max_workers: int = 4,
+                 domain_limits: Optional[Dict[str, int]] = None,
+                 default_domain_limit: int = 2,
+                 domain_rates: Optional[Dict[str, float]] = None,
+                 agent_factory: Callable[[], AutonomousBrowserAgent] = AutonomousBrowserAgent,
+                 step_budgets: Optional[StepBudgetModel] = None,
+                 wait_history: int = 1000,
+                 coalesce: bool = True, result_ttl: float = 5.0,
+                 site_state: Optional[Callable[[str], Hashable]] = None):
+        self.max_workers = max_workers
+        self.domain_limits = domain_limits or {}
+        self.default_domain_limit = default_domain_limit
+        self.agent_factory = agent_factory
+        # Общая для всех агентов статистика шагов по намерениям
+        self.step_budgets = step_budgets or StepBudgetModel()
+        # Состояние сайта, с которого начнет агент (например, версия сессии); часть ключа объединения
+        self.site_state = site_state
+        self._flights = SingleFlight(
+            ttl=result_ttl, name="task_result",
+            cacheable=lambda result: result["summary"]["final_status"] == "completed",
+        ) if coalesce else None
+
+        self._buckets = {domain: TokenBucket(rate, burst=max(1, int(rate)))
+                         for domain, rate in (domain_rates or {}).items()}
+        # отправитель -> домен -> куча задач
+        self._queues: Dict[str, Dict[str, List[ScheduledTask]]] = {}
+        self._running: Dict[str, int] = {}
+        self._last_served: Dict[str, int] = {}
+        self._serve_counter = itertools.count()
+        self._sequence = itertools.count()
+        self._active = 0
+        self._completed = 0
+        self._waits = deque(maxlen=wait_history)
+
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agent")
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="task-scheduler", daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, task: str, submitter: str = "default", priority: int = 0,
+               domain: Optional[str] = None, timeout: Optional[float] = None) -> Future:
+        """Постановка задачи в очередь; результат process_task() придет в Future
+
+        timeout отсчитывается от начала выполнения, а не от постановки в очередь.
+        При объединении с уже идущей задачей действуют параметры первой отправки.
+        """
+        domain = domain or task_domain(task)
+        if self._flights is None:
+            return self._enqueue(task, submitter, priority, domain, timeout)
+
+        key = (" ".join(normalize_text(task)), domain,
+               self.site_state(domain) if self.site_state is not None else None)
+        return self._flights.submit(key, lambda: self._enqueue(task, submitter, priority, domain, timeout))
+
+    def _enqueue(self, task: str, submitter: str, priority: int, domain: str,
+                 timeout: Optional[float]) -> Future:
+        future = Future()
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError("Планировщик остановлен")
+            scheduled = ScheduledTask(
+                sort_key=(-priority, next(self._sequence)), task=task, submitter=submitter,
+                domain=domain, priority=priority, submitted_at=time.monotonic(), future=future,
+                timeout=timeout,
+            )
+            heapq.heappush(self._queues.setdefault(submitter, {}).setdefault(domain, []), scheduled)
+            self._condition.notify_all()
+        return future
+
+    def metrics(self) -> Dict[str, Any]:
+        """Глубина очередей и статистика ожидания"""
+        with self._condition:
+            depth_by_domain: Dict[str, int] = {}
+            depth_by_submitter: Dict[str, int] = {}
+            for submitter, domains in self._queues.items():
+                for domain, tasks in domains.items():
+                    depth_by_domain[domain] = depth_by_domain.get(domain, 0) + len(tasks)
+                    depth_by_submitter[submitter] = depth_by_submitter.get(submitter, 0) + len(tasks)
+            waits = sorted(self._waits)
+
+        def percentile(p: float) -> float:
+            return waits[min(len(waits) - 1, int(p * len(waits)))] if waits else 0.0
+
+        return {
+            "queue_depth": sum(depth_by_domain.values()),
+            "queue_depth_by_domain": depth_by_domain,
+            "queue_depth_by_submitter": depth_by_submitter,
+            "running_by_domain": {d: n for d, n in self._running.items() if n},
+            "active": self._active,
+            "completed": self._completed,
+            "coalescing": self._flights.metrics() if self._flights is not None else None,
+            "wait_time": {
+                "avg": sum(waits) / len(waits) if waits else 0.0,
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "max": waits[-1] if waits else 0.0,
+            },
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Остановка: новые задачи не принимаются, очередь дорабатывается при wait=True"""
+        cancelled: List[Future] = []
+        with self._condition:
+            self._stopped = True
+            if not wait:
+                for domains in self._queues.values():
+                    for tasks in domains.values():
+                        cancelled.extend(scheduled.future for scheduled in tasks)
+                self._queues.clear()
+            self._condition.notify_all()
+        # Отмена — вне блокировки: колбэки Future (объединение задач) берут свои блокировки
+        for future in cancelled:
+            future.cancel()
+        self._dispatcher.join()
+        self._executor.shutdown(wait=wait)
+
+    def _domain_available(self, domain: str, now: float) -> bool:
+        limit = self.domain_limits.get(domain, self.default_domain_limit)
+        if self._running.get(domain, 0) >= limit:
+            return False
+        bucket = self._buckets.get(domain)
+        return bucket is None or bucket.wait_time(now) == 0.0
+
+    def _pick(self, now: float) -> Optional[ScheduledTask]:
+        best = None
+        best_key = None
+        for submitter, domains in self._queues.items():
+            for domain, tasks in domains.items():
+                if not tasks or not self._domain_available(domain, now):
+                    continue
+                head = tasks[0]
+                key = (-head.priority, self._last_served.get(submitter, -1), head.sort_key[1])
+                if best_key is None or key < best_key:
+                    best, best_key = head, key
+        return best
+
+    def _next_wakeup(self, now: float) -> Optional[float]:
+        """Через сколько освободится лимит частоты для ожидающих доменов"""
+        delays = [self._buckets[domain].wait_time(now)
+                  for domains in self._queues.values()
+                  for domain, tasks in domains.items()
+                  if tasks and domain in self._buckets]
+        delays = [d for d in delays if d > 0]
+        return min(delays) if delays else None
+
+    def _has_queued(self) -> bool:
+        return any(tasks for domains in self._queues.values() for tasks in domains.values())
+
+    def _dispatch_loop(self) -> None:
+        with self._condition:
+            while True:
+                if self._stopped and not self._has_queued():
+                    return
+
+                now = time.monotonic()
+                scheduled = self._pick(now) if self._active < self.max_workers else None
+                if scheduled is None:
+                    self._condition.wait(timeout=self._next_wakeup(now))
+                    continue
+
+                queue = self._queues[scheduled.submitter][scheduled.domain]
+                heapq.heappop(queue)
+                if not queue:
+                    del self._queues[scheduled.submitter][scheduled.domain]
+                    if not self._queues[scheduled.submitter]:
+                        del self._queues[scheduled.submitter]
+
+                if not scheduled.future.set_running_or_notify_cancel():
+                    continue
+
+                bucket = self._buckets.get(scheduled.domain)
+                if bucket is not None:
+                    bucket.try_acquire(now)
+                self._running[scheduled.domain] = self._running.get(scheduled.domain, 0) + 1
+                self._active += 1
+                self._last_served[scheduled.submitter] = next(self._serve_counter)
+                self._waits.append(now - scheduled.submitted_at)
+                self._executor.submit(self._run, scheduled)
+
+    def _run(self, scheduled: ScheduledTask) -> None:
+        try:
+            agent = self.agent_factory()
+            agent.step_budgets = self.step_budgets
+            result = agent.process_task(scheduled.task, timeout=scheduled.timeout)
+        except Exception as e:
+            scheduled.future.set_exception(e)
+        else:
+            scheduled.future.set_result(result)
+        finally:
+            with self._condition:
+                self._running[scheduled.domain] -= 1
+                self._active -= 1
+                self._completed += 1
+                self._condition.notify_all()
@@ -0,0 +1,16 @@
+# tests/test_pipelined.py
+from agent_core import AutonomousBrowserAgent
+
+
+def _commands(pipelined: bool, task: str):
+    agent = AutonomousBrowserAgent(pipelined=pipelined)
+    agent.llm.max_context_elements = 2
+    result = agent.process_task(task)
+    return [(s["command"]["action"], s["command"].get("selector"), s["command"].get("url"))
+            for s in result["steps"]]
+
+
+def test_pipelined_matches_sequential_with_small_context_budget():
+    """Спекулятивные решения совпадают с последовательными и при урезанном контексте"""
+    for task in ("Удали спам в почте", "Прочитай последние 10 писем в почте и удали спам"):
+        assert _commands(True, task) == _commands(False, task)
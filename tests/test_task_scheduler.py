@@ -0,0 +1,66 @@
+# tests/test_task_scheduler.py
+import threading
+import time
+from concurrent.futures import Future
+
+from single_flight import SingleFlight
+from task_scheduler import TaskScheduler
+
+
+class SlowAgent:
+    """Агент-заглушка: задача занимает воркер на delay секунд"""
+
+    delay = 0.05
+
+    def process_task(self, task, timeout=None):
+        time.sleep(self.delay)
+        return {"task": task, "summary": {"final_status": "completed"}}
+
+
+def test_submit_racing_shutdown_does_not_deadlock():
+    """submit() и shutdown(wait=False) берут блокировки планировщика и объединения в разном порядке"""
+    for attempt in range(30):
+        scheduler = TaskScheduler(max_workers=1, agent_factory=SlowAgent)
+        for i in range(20):
+            scheduler.submit(f"задача {attempt} {i}")
+        barrier = threading.Barrier(2)
+
+        def submitter():
+            barrier.wait()
+            for i in range(200):
+                try:
+                    scheduler.submit(f"еще задача {attempt} {i}")
+                except RuntimeError:
+                    return
+
+        def stopper():
+            barrier.wait()
+            scheduler.shutdown(wait=False)
+
+        threads = [threading.Thread(target=submitter, daemon=True), threading.Thread(target=stopper, daemon=True)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+            assert not thread.is_alive(), "submit() и shutdown() зависли"
+
+
+def test_cancelled_submit_results_are_cancelled_for_all_waiters():
+    scheduler = TaskScheduler(max_workers=1, agent_factory=SlowAgent)
+    scheduler.submit("первая задача")
+    first = scheduler.submit("вторая задача")
+    second = scheduler.submit("вторая задача")
+    scheduler.shutdown(wait=False)
+    assert first.cancelled() and second.cancelled()
+
+
+def test_relay_into_cancelled_follower_is_ignored():
+    """Ожидающий может отменить свой Future в любой момент, в том числе во время передачи результата"""
+    flights = SingleFlight()
+    leader = Future()
+    follower = flights.submit("key", lambda: leader)
+    follower.cancel()
+    # Эмулируем гонку: отмена произошла уже после проверки cancelled()
+    SingleFlight._relay(leader, follower)
+    leader.set_result(1)
+    assert follower.cancelled()